@@ -0,0 +1,116 @@
+import asyncio
+from collections import deque
+
+
+# Seconds the client waits for a response, sent with every request
+TIMEOUT_HEADER = 'X-Timeout'
+
+
+class Overloaded(Exception):
+    pass
+
+
+def get_deadline(headers):
+    """Returns the loop time until which the client waits for a response."""
+    try:
+        timeout = float(headers[TIMEOUT_HEADER])
+    except (KeyError, ValueError):
+        return None
+    return asyncio.get_event_loop().time() + timeout
+
+
+class Limiter:
+    """Bounds concurrent calls and the number of calls waiting for a slot.
+
+    A released slot is handed to the longest waiting call.
+    """
+
+    def __init__(self, limit, queue_size=0):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters = deque()
+
+    def full(self):
+        return self.active >= self.limit and len(self.waiters) >= self.queue_size
+
+    @asyncio.coroutine
+    def acquire(self, timeout=None):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        if len(self.waiters) >= self.queue_size or (timeout is not None and timeout <= 0):
+            raise Overloaded()
+
+        waiter = asyncio.Future()
+        self.waiters.append(waiter)
+        try:
+            yield from asyncio.wait([waiter], timeout=timeout)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        if not waiter.done():
+            self._abandon(waiter)
+            raise Overloaded()
+
+    def _abandon(self, waiter):
+        if waiter.done():
+            # The slot was handed over already
+            self.release()
+        else:
+            waiter.cancel()
+            self.waiters.remove(waiter)
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class Admission:
+    """Global and per-method limits of concurrently executed calls.
+
+    A call over a limit waits in a queue of at most ``queue_size`` calls for
+    up to ``queue_timeout`` seconds, and not past the deadline set by the
+    client. Calls which are not admitted are answered with 503.
+    ``method_limits`` maps method names to their limits.
+    """
+
+    def __init__(self, limit=None, method_limits=None, queue_size=0, queue_timeout=None):
+        self.limiter = Limiter(limit, queue_size) if limit else None
+        self.method_limiters = {
+            name: Limiter(method_limit, queue_size) for name, method_limit in (method_limits or dict()).items()
+        }
+        self.queue_timeout = queue_timeout
+
+    def shedding(self):
+        """Whether a new call would be rejected whatever method it calls."""
+        return self.limiter is not None and self.limiter.full()
+
+    def _timeout(self, deadline):
+        if deadline is None:
+            return self.queue_timeout
+        remaining = deadline - asyncio.get_event_loop().time()
+        return remaining if self.queue_timeout is None else min(self.queue_timeout, remaining)
+
+    @asyncio.coroutine
+    def acquire(self, name, deadline=None):
+        """Returns the limiters the call holds or raises Overloaded."""
+        acquired = list()
+        try:
+            for limiter in (self.method_limiters.get(name), self.limiter):
+                if limiter is not None:
+                    yield from limiter.acquire(self._timeout(deadline))
+                    acquired.append(limiter)
+        except BaseException:
+            self.release(acquired)
+            raise
+        return acquired
+
+    @staticmethod
+    def release(limiters):
+        for limiter in limiters:
+            limiter.release()
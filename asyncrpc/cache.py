@@ -0,0 +1,81 @@
+import json
+import time
+import asyncio
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Cache of results of idempotent methods.
+
+    Only methods listed in ``ttls`` (name to seconds) are cached, unless
+    ``ttl`` sets a default for all of them. Results are keyed by method
+    name and params; at most ``max_size`` of them are kept, and the least
+    recently used ones are evicted first. Concurrent calls with the same key
+    share one call; with a TTL of 0 results are shared only by such calls.
+    Errors are not cached, and a cached result is the same object for every
+    caller.
+    """
+
+    def __init__(self, ttls=None, ttl=None, max_size=1024):
+        self.ttls = ttls or dict()
+        self.ttl = ttl
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.in_flight = dict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(method, params):
+        try:
+            return method, json.dumps(params, sort_keys=True, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return entry
+
+    def set(self, key, result, ttl):
+        self.data[key] = time.monotonic() + ttl, result
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+
+    @asyncio.coroutine
+    def call(self, method, params, call, timeout=None):
+        """Returns the cached result or the result of coroutine call().
+
+        ``timeout`` bounds the wait of this caller only.
+        """
+        ttl = self.ttls.get(method, self.ttl)
+        key = self._key(method, params) if ttl is not None else None
+        if key is None:
+            return (yield from call())
+
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+
+        task = self.in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self.in_flight[key] = asyncio.ensure_future(call())
+            task.add_done_callback(lambda task: self._done(key, task, ttl))
+        # A caller which gives up does not cancel the request of the others
+        return (yield from asyncio.wait_for(asyncio.shield(task), timeout))
+
+    def _done(self, key, task, ttl):
+        del self.in_flight[key]
+        if not task.cancelled() and task.exception() is None and ttl > 0:
+            self.set(key, task.result(), ttl)
@@ -1,12 +1,43 @@
-import json
+import os
 import uuid
-import inspect
+import itertools
 import aiohttp
 import asyncio
 import traceback
-from collections import OrderedDict
+from functools import partial
+from collections.abc import Iterator
 
 from asyncrpc.cleaner import Cleaner
+from asyncrpc.admission import Overloaded, get_deadline
+from asyncrpc.profiling import NULL_TIMER
+from asyncrpc.codecs import JSON, get_codec, negotiate
+from asyncrpc.compression import NATIVE, decompress_offloaded, negotiate as negotiate_encoding
+
+
+STREAM = 'application/x-ndjson'
+
+
+class IdGenerator:
+    """Generates unique request ids from a random prefix and a counter.
+
+    Ids are never numeric strings, which the server does not deduplicate.
+    A forked child process gets a new prefix.
+    """
+
+    def __init__(self):
+        self.reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        self.prefix = uuid.uuid4().hex + '-'
+        self.counter = itertools.count()
+
+    def __call__(self):
+        return self.prefix + str(next(self.counter))
+
+
+generate_id = IdGenerator()
 
 
 def _create_request(method, *args, **kwargs):
@@ -14,117 +45,475 @@ def _create_request(method, *args, **kwargs):
         jsonrpc='2.0',
         method=method,
         params=args or kwargs,
-        id=str(uuid.uuid1())
+        id=generate_id()
     )
 
 
+class RequestEncoder:
+    """Encodes requests with the codec.
+
+    For JSON the envelope up to the id is encoded once per method name, and
+    only the id and params are encoded per request.
+    """
+    max_templates = 1024
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.templates = dict() if codec.content_type == JSON else None
+
+    def encode(self, method, params, request_id):
+        if self.templates is None:
+            return self.codec.dumps(dict(jsonrpc='2.0', method=method, params=params, id=request_id))
+
+        template = self.templates.get(method)
+        if template is None:
+            template = b'{"jsonrpc": "2.0", "method": ' + self.codec.dumps(method) + b', "id": '
+            if len(self.templates) < self.max_templates:
+                self.templates[method] = template
+        return b''.join((template, self.codec.dumps(request_id), b', "params": ', self.codec.dumps(params), b'}'))
+
+
 def create_request(method, *args, **kwargs):
     return serialize(_create_request(method, *args, **kwargs))
 
 
 class RequestsStorage(Cleaner):
+    """Deduplicates requests by id and keeps their responses.
+
+    Registration is a plain check-and-set, which is atomic within the event
+    loop. Every duplicate waits on the future of the first request and gets
+    its response, so retries do not execute the method again. A request
+    which was cancelled before it was answered, e.g. because its connection
+    was closed, is registered anew by the next duplicate.
+    """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    def __init__(self, clear_timeout=60, max_size=10000, **kwargs):
+        super().__init__(clear_timeout=clear_timeout, max_size=max_size, **kwargs)
 
-        self.events = OrderedDict()
-        self.lock = asyncio.Lock()
+    def register(self, request_id):
+        """Returns the request's future and whether this call registered it."""
+        future = self.data.get(request_id)
+        if future is not None and not future.cancelled():
+            self.touch(request_id)
+            return future, False
 
-    def is_called(self, request_id):
-        return request_id in self.data
+        future = asyncio.Future()
+        self.add(request_id, future)
+        return future, True
 
-    def set_result(self, request_id):
-        if request_id not in self.data:
-            self.events[request_id] = asyncio.Event()
-            self.data[request_id] = dict()
+    @staticmethod
+    def set(future, response):
+        if not future.done():
+            future.set_result(response)
 
+    @staticmethod
     @asyncio.coroutine
-    def wait(self, request_id):
-        yield from self.events[request_id].wait()
+    def wait(future):
+        """Returns the cached response or None if the first request was cancelled."""
+        try:
+            return (yield from asyncio.shield(future))
+        except asyncio.CancelledError:
+            if future.cancelled():
+                return None
+            raise
 
-    def set(self, request_id):
-        self.events[request_id].set()
 
-    def popleft(self, count):
-        for _ in range(count):
-            self.events.popitem(last=False)
+def serialize(value, content_type=None):
+    return get_codec(content_type).dumps(value)
 
-        super().popleft(count)
 
+def deserialize(data, content_type=None):
+    return get_codec(content_type).loads(data)
 
-def serialize(value):
-    return json.dumps(value).encode()
+
+def isinteger(value):
+    if isinstance(value, (int, float)):
+        return True
+    return isinstance(value, str) and value.lstrip('-').isdigit()
 
 
-def deserialize(data):
-    return json.loads(data.decode())
+def deduplicated(request_id):
+    """Whether duplicates of the id get the response of the first request.
 
+    Numeric and null ids may be reused by clients, so they are not.
+    """
+    return request_id is not None and not isinteger(request_id)
 
-def isinteger(value):
-    try:
-        int(value)
-        return True
-    except ValueError:
-        return False
+
+def _isasyncgen(value):
+    return hasattr(value, '__anext__')
 
 
 @asyncio.coroutine
-def _call_method(obj, storage, methods, request):
-    try:
-        with (yield from storage.lock):
-            flag_called = storage.is_called(request['id'])
-            storage.set_result(request['id'])
+def _materialize(result):
+    if _isasyncgen(result):
+        items = list()
+        while True:
+            try:
+                items.append((yield from result.__anext__()))
+            except StopAsyncIteration:
+                return items
+    if isinstance(result, (Iterator, range, set, frozenset)):
+        return list(result)
+    return result
 
-        if not isinteger(request['id']) and flag_called:
-            yield from storage.wait(request['id'])
-            respond = dict(
-                jsonrpc='2.0',
-                error='Method {} was already called'.format(request['method']),
-                id=request['id']
-            )
-            return respond, 202
 
-        if request['method'] not in methods:
+@asyncio.coroutine
+def _invoke(method, params, stream=False):
+    if isinstance(params, dict):
+        result = method.call(**params)
+    else:
+        result = method.call(*params)
+    if method.awaitable:
+        result = yield from result
+
+    # Streamed results are iterated while the response is written
+    if not stream:
+        result = yield from _materialize(result)
+    return result
+
+
+@asyncio.coroutine
+def _execute(methods, request, stream=False):
+    try:
+        method = methods.get(request['method'])
+        if method is None:
             respond = dict(
                 jsonrpc='2.0',
                 error='Method {} does not exist'.format(request['method']),
-                id=request['id']
+                id=request.get('id')
             )
-            storage.set(request['id'])
             return respond, 405
 
-        method = getattr(obj, request['method'])
+        # Params may be omitted by the JSON-RPC spec
+        params = request.get('params', [])
+        if method.validate is not None:
+            error = method.validate(params)
+            if error is not None:
+                respond = dict(
+                    jsonrpc='2.0',
+                    error='Invalid params of method {}: {}'.format(request['method'], error),
+                    id=request.get('id')
+                )
+                return respond, 400
 
-        if inspect.isgeneratorfunction(methods[request['method']]):
-            if isinstance(request['params'], dict):
-                result = yield from method(**request['params'])
-            else:
-                result = yield from method(*request['params'])
+        if method.cache is not None and not stream:
+            result = yield from method.cache.call(request['method'], params, partial(_invoke, method, params))
         else:
-            if isinstance(request['params'], dict):
-                result = method(**request['params'])
-            else:
-                result = method(*request['params'])
+            result = yield from _invoke(method, params, stream)
 
         respond = dict(
             jsonrpc='2.0',
             result=result,
-            id=request['id']
+            id=request.get('id')
         )
-        storage.set(request['id'])
         return respond, 200
+    except asyncio.CancelledError:
+        raise
     except:
         respond = dict(
             jsonrpc='2.0',
             error=traceback.format_exc(),
-            id=request['id']
+            id=request.get('id')
         )
-        storage.set(request['id'])
         return respond, 500
 
+
+def _overloaded(request_id):
+    respond = dict(
+        jsonrpc='2.0',
+        error='Server is overloaded',
+        id=request_id
+    )
+    return respond, 503
+
+
+OVERLOADED = serialize(_overloaded(None)[0])
+
+
+def _deadline_exceeded(request_id):
+    respond = dict(
+        jsonrpc='2.0',
+        error='Deadline exceeded',
+        id=request_id
+    )
+    return respond, 504
+
+
+@asyncio.coroutine
+def _call_admitted(methods, request, stream=False, admission=None, deadline=None):
+    admitted = ()
+    try:
+        if admission is not None:
+            admitted = yield from admission.acquire(request.get('method'), deadline)
+        execution = _execute(methods, request, stream)
+        if deadline is not None:
+            # The method is cancelled once the client stops waiting for it
+            execution = asyncio.wait_for(execution, deadline - asyncio.get_event_loop().time())
+        return (yield from execution)
+    except Overloaded:
+        return _overloaded(request.get('id'))
+    except asyncio.TimeoutError:
+        return _deadline_exceeded(request.get('id'))
+    finally:
+        if admission is not None:
+            admission.release(admitted)
+
+
+@asyncio.coroutine
+def _call_unique(obj, storage, methods, request, stream=False, admission=None, deadline=None,
+                 timer=NULL_TIMER):
+    if 'id' not in request:
+        # Nobody waits for the response of a notification, so it is not stored
+        return (yield from _call_admitted(methods, request, stream, admission, deadline))
+
+    future, flag_registered = storage.register(request['id'])
+
+    while not flag_registered and deduplicated(request['id']):
+        response = yield from storage.wait(future)
+        if response is not None:
+            timer.mark('dedup')
+            return response
+        if future.cancelled():
+            # The copy which executed the request was cancelled, so one of
+            # the duplicates executes it instead
+            future, flag_registered = storage.register(request['id'])
+            continue
+        timer.mark('dedup')
+        respond = dict(
+            jsonrpc='2.0',
+            error='Method {} was already called'.format(request.get('method')),
+            id=request['id']
+        )
+        return respond, 202
+
+    timer.mark('dedup')
+    # Only the copy which executes the request takes a slot
+    try:
+        with timer.profile(request.get('method')):
+            response = yield from _call_admitted(methods, request, stream, admission, deadline)
+    except BaseException:
+        future.cancel()
+        raise
+    timer.mark('execute')
+    # A stream is consumed once, so duplicates of it are not answered with it
+    storage.set(future, None if stream else response)
+    return response
+
+
+@asyncio.coroutine
+def _call_method(obj, storage, methods, request, metrics=None, stream=False, admission=None, deadline=None,
+                 timer=NULL_TIMER):
+    if not isinstance(request, dict):
+        return _invalid_request()
+    if not isinstance(request.get('method'), str):
+        return _invalid_request(request.get('id'))
+    if metrics is None:
+        return (yield from _call_unique(obj, storage, methods, request, stream, admission, deadline, timer))
+
+    # Unknown names are not used as labels to keep metrics bounded
+    name = request.get('method')
+    if name not in methods:
+        name = '<unknown>'
+
+    start_ts = metrics.start(name)
+    status = 500
+    try:
+        response = yield from _call_unique(obj, storage, methods, request, stream, admission, deadline, timer)
+        status = response[1]
+        return response
+    finally:
+        metrics.finish(name, status, start_ts)
+
+
+def _invalid_request(request_id=None):
+    respond = dict(
+        jsonrpc='2.0',
+        error='Invalid Request',
+        id=request_id
+    )
+    return respond, 400
+
+
+def _answered(request):
+    # Notifications in a batch are executed but not answered
+    return not isinstance(request, dict) or 'id' in request
+
+
 @asyncio.coroutine
-def call_method(obj, storage, methods, request):
+def _call_batch(obj, storage, methods, requests, metrics=None, admission=None, deadline=None):
+    if not requests:
+        respond = dict(
+            jsonrpc='2.0',
+            error='Batch is empty',
+            id=None
+        )
+        return respond, 400
+
+    # The client sends the same batch to every interface; every request of
+    # it is deduplicated by its own id, like a request sent alone.
+    results = yield from asyncio.gather(
+        *[
+            _call_method(obj, storage, methods, request, metrics, admission=admission, deadline=deadline)
+            for request in requests
+        ]
+    )
+    return [respond for (respond, _), request in zip(results, requests) if _answered(request)], 200
+
+
+@asyncio.coroutine
+def dispatch(obj, storage, methods, request, metrics=None, admission=None, deadline=None, timer=NULL_TIMER):
+    if isinstance(request, list):
+        # Phases of a batch are timed as a whole
+        response = yield from _call_batch(obj, storage, methods, request, metrics, admission, deadline)
+        timer.mark('execute')
+        return response
+    return (yield from _call_method(
+        obj, storage, methods, request, metrics, admission=admission, deadline=deadline, timer=timer
+    ))
+
+
+@asyncio.coroutine
+def _next(iterator):
+    try:
+        return next(iterator)
+    except StopIteration:
+        raise StopAsyncIteration
+
+
+def _stream_items(result):
+    """Returns a coroutine function which returns the next item to stream."""
+    if _isasyncgen(result):
+        return result.__anext__
+    if not isinstance(result, (list, tuple)) and not hasattr(result, '__next__'):
+        result = [result]
+    return partial(_next, iter(result))
+
+
+@asyncio.coroutine
+def call_stream(obj, storage, methods, request, body, metrics=None, admission=None, deadline=None):
+    """Writes every item of the result as a JSON-RPC response on its own line."""
+    codec = get_codec()
+    respond, status = yield from _call_method(
+        obj, storage, methods, body, metrics, stream=True, admission=admission, deadline=deadline
+    )
+    if status != 200:
+        return aiohttp.web.Response(body=codec.dumps(respond), status=status, content_type=codec.content_type)
+
+    response = aiohttp.web.StreamResponse(status=200)
+    response.content_type = STREAM
+    response.enable_chunked_encoding()
+    yield from response.prepare(request)
+
+    next_item = _stream_items(respond['result'])
+    while True:
+        try:
+            item = yield from next_item()
+            data = codec.dumps(dict(jsonrpc='2.0', result=item, id=body['id']))
+        except StopAsyncIteration:
+            break
+        except Exception:
+            data = codec.dumps(dict(jsonrpc='2.0', error=traceback.format_exc(), id=body['id']))
+            yield from response.write(data + b'\n')
+            break
+        yield from response.write(data + b'\n')
+
+    yield from response.write_eof()
+    return response
+
+
+_background = set()
+
+
+def _run_in_background(coro):
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+@asyncio.coroutine
+def call_method(obj, storage, methods, request, metrics=None, compression=None, admission=None, profiler=None):
+    timer = NULL_TIMER if profiler is None else profiler.timer()
     storage.try_clear()
+    timer.mark('sweep')
+    # Under overload requests are rejected before they are read and decoded
+    if admission is not None and admission.shedding():
+        return aiohttp.web.Response(body=OVERLOADED, status=503, content_type=JSON)
+
+    deadline = get_deadline(request.headers)
     data = yield from request.read()
-    response, status = yield from _call_method(obj, storage, methods, deserialize(data))
-    return aiohttp.web.Response(body=serialize(response), status=status)
+    timer.mark('read')
+    encoding = request.headers.get('Content-Encoding')
+    if encoding in NATIVE:
+        # aiohttp has decoded the body already
+        encoding = None
+    if compression is not None:
+        data = yield from compression.decompress(data, encoding)
+    else:
+        data = yield from decompress_offloaded(data, encoding)
+    codec = get_codec(request.content_type)
+    body = codec.loads(data)
+    timer.mark('deserialize')
+    if isinstance(body, dict) and 'id' not in body:
+        # A notification is acknowledged before it is executed
+        _run_in_background(_call_method(obj, storage, methods, body, metrics, admission=admission))
+        return aiohttp.web.Response(status=204)
+    if STREAM in request.headers.get('Accept', '') and isinstance(body, dict):
+        return (yield from call_stream(obj, storage, methods, request, body, metrics, admission, deadline))
+
+    method = body.get('method') if isinstance(body, dict) else '<batch>'
+    response, status = yield from dispatch(obj, storage, methods, body, metrics, admission, deadline, timer)
+    codec = negotiate(request.headers.get('Accept'), codec)
+    body, headers = codec.dumps(response), None
+    timer.mark('serialize')
+    if compression is not None:
+        body, encoding = yield from compression.compress(
+            negotiate_encoding(request.headers.get('Accept-Encoding')), body
+        )
+        if encoding is not None:
+            headers = {'Content-Encoding': encoding}
+        timer.mark('compress')
+    timer.finish(method)
+    return aiohttp.web.Response(body=body, status=status, content_type=codec.content_type, headers=headers)
+
+
+@asyncio.coroutine
+def _call_ws_message(obj, storage, methods, ws, codec, data, metrics=None, admission=None):
+    body = codec.loads(data)
+    response, status = yield from dispatch(obj, storage, methods, body, metrics, admission)
+    # A duplicate of the same id sent over another interface answers with the
+    # stored response of the copy which executed the request, or executes it
+    # if that copy's connection was closed; the client takes the first answer
+    # and drops the rest. Notifications are not answered at all.
+    if status != 202 and (not isinstance(body, dict) or 'id' in body):
+        yield from ws.send_bytes(codec.dumps(response))
+
+
+@asyncio.coroutine
+def call_ws(obj, storage, methods, request, metrics=None, admission=None):
+    # Frames are encoded with the codec the client accepted on handshake
+    codec = negotiate(request.headers.get('Accept'))
+    ws = aiohttp.web.WebSocketResponse()
+    yield from ws.prepare(request)
+
+    tasks = set()
+    try:
+        while True:
+            msg = yield from ws.receive()
+            if msg.type == aiohttp.WSMsgType.BINARY:
+                data = msg.data
+            elif msg.type == aiohttp.WSMsgType.TEXT:
+                data = msg.data.encode()
+            else:
+                break
+
+            storage.try_clear()
+            task = asyncio.ensure_future(
+                _call_ws_message(obj, storage, methods, ws, codec, data, metrics, admission)
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return ws
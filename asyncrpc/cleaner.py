@@ -1,37 +1,88 @@
 import time
-from collections import OrderedDict
+from collections import deque, OrderedDict
 
 
 class Cleaner:
+    """Keeps every added value for at least ``clear_timeout`` seconds.
 
-    def __init__(self, clear_timeout=60):
-        self.data = OrderedDict()
+    Keys are grouped into time buckets ``clear_timeout / buckets`` seconds wide.
+    Each ``try_clear`` evicts at most ``clear_batch`` expired keys, so eviction
+    is spread over requests instead of happening in one burst. When
+    ``max_size`` is set, adding a key over the limit evicts the least
+    recently used one. ``touch`` renews a key as if it was added again.
+    """
 
-        self.monitoring_timeout = clear_timeout / 2
+    def __init__(self, clear_timeout=60, max_size=None, buckets=10, clear_batch=100):
+        self.data = dict()
 
-        self.__start_ts = None
-        self.__finish_ts = None
-        self.__clear_count = 0
+        self.clear_timeout = clear_timeout
+        self.bucket_timeout = clear_timeout / buckets
+        self.max_size = max_size
+        self.clear_batch = clear_batch
 
-    def popleft(self, count):
-        for _ in range(count):
-            _, v = self.data.popitem(last=False)
-            v.clear()
-        self.__start_ts = None
-        self.__finish_ts = None
+        self.buckets = deque()
+        # A touched key is moved to the newest bucket and keeps its place in
+        # older ones, so it is queued at most once per bucket. It is only
+        # removed when its last queued occurrence is evicted.
+        self.touches = dict()
 
-    def try_clear(self):
-        if self.__start_ts is None:
-            self.__start_ts = time.perf_counter()
-            return
+    def __len__(self):
+        return len(self.data)
 
-        if time.perf_counter() - self.__start_ts > self.monitoring_timeout and self.__finish_ts is None:
-            self.__finish_ts = time.perf_counter()
-            self.__clear_count = len(self.data)
-            return
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
 
-        if self.__finish_ts and time.perf_counter() - self.__finish_ts > self.monitoring_timeout:
-            self.popleft(self.__clear_count)
-            self.__start_ts = None
-            self.__finish_ts = None
+    def add(self, key, value):
+        if key in self.data:
+            self.data[key] = value
             return
+
+        self._append(key)
+        self.data[key] = value
+
+        if self.max_size is not None and len(self.data) > self.max_size:
+            while not self.popleft():
+                pass
+
+    def touch(self, key):
+        if key in self.data and self._append(key):
+            self.touches[key] = self.touches.get(key, 0) + 1
+
+    def _append(self, key):
+        """Queues the key last and returns False if it was in the newest bucket."""
+        now = time.perf_counter()
+        if not self.buckets or now - self.buckets[-1][0] >= self.bucket_timeout:
+            self.buckets.append((now, OrderedDict()))
+        keys = self.buckets[-1][1]
+        if key in keys:
+            keys.move_to_end(key)
+            return False
+        keys[key] = None
+        return True
+
+    def popleft(self):
+        """Pops the oldest queued key and returns True if it was removed."""
+        _, keys = self.buckets[0]
+        key, _ = keys.popitem(last=False)
+        if not keys:
+            self.buckets.popleft()
+
+        touches = self.touches.pop(key, 0)
+        if touches:
+            if touches > 1:
+                self.touches[key] = touches - 1
+            return False
+
+        del self.data[key]
+        return True
+
+    def try_clear(self):
+        # A bucket expires once its newest key is older than clear_timeout
+        expire_ts = time.perf_counter() - self.clear_timeout - self.bucket_timeout
+        for _ in range(self.clear_batch):
+            if not self.buckets or self.buckets[0][0] > expire_ts:
+                return
+            self.popleft()
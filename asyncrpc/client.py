@@ -2,16 +2,24 @@ import sys
 import ssl
 import time
 import asyncio
-from collections import deque
+from functools import partial
 
 import aiohttp
 from aiohttp import ClientOSError
 
-from asyncrpc.call import create_request, deserialize
+from asyncrpc.call import _create_request, _call_method, _run_in_background, generate_id, RequestEncoder, STREAM
+from asyncrpc.codecs import get_codec
+from asyncrpc.metrics import Metrics
+from asyncrpc.admission import TIMEOUT_HEADER
+from asyncrpc.compression import compressors, accept_encoding, decompress_offloaded
+from asyncrpc.endpoints import LatencyTracker, EndpointHealth
 
 
 PY_35 = sys.version_info >= (3, 5)
 
+# A call cancelled this close to its deadline counts as timed out
+DEADLINE_SLACK = 0.001
+
 
 class _ContextManager:
 
@@ -94,97 +102,376 @@ class RPCMethodException(Exception):
 
 
 @asyncio.coroutine
-def wait_first_completed(futures):
+def wait_first_completed(futures, deadline=None):
+    """Waits for the first successful response.
+
+    Raises asyncio.TimeoutError once the loop time passes deadline; the
+    requests still in flight are cancelled then.
+    """
+    loop = asyncio.get_event_loop()
+    futures = [asyncio.ensure_future(f) for f in futures]
+
     flag_completed = False
 
     response = tuple()
 
-    timeout = 5
-    while not flag_completed:
-        done, pending = (yield from asyncio.wait(futures, return_when=asyncio.FIRST_COMPLETED, timeout=timeout))
-
-        error_info = None
-        for f in done:
-            try:
-                result, status, headers = f.result()
-                response = result, status, headers
-                if status != 200:
-                    if status == 500:
-                        error_info = result
-                    continue
-                flag_completed = True
+    try:
+        while not flag_completed:
+            timeout = None if deadline is None else deadline - loop.time()
+            done, pending = (yield from asyncio.wait(futures, return_when=asyncio.FIRST_COMPLETED, timeout=timeout))
+            if not done:
+                raise asyncio.TimeoutError()
+
+            error_info = None
+            for f in done:
+                try:
+                    result, status, headers = f.result()
+                    response = result, status, headers
+                    if status != 200:
+                        if status == 500:
+                            error_info = result
+                        continue
+                    flag_completed = True
+                    break
+                except:
+                    pass
+
+            if flag_completed:
                 break
-            except:
-                pass
 
-        timeout /= 2
+            if pending:
+                futures = list(pending)
+            else:
+                try:
+                    if error_info is not None:
+                        raise RPCMethodException(error_info)
+                    done.pop().result()  # raise exception
+                    return response + (pending,)
+                except ClientOSError:
+                    raise RequestError()
+    except asyncio.TimeoutError:
+        for f in futures:
+            f.cancel()
+        raise
 
-        if flag_completed:
-            break
+    return result, status, headers, pending
 
-        if pending:
-            futures = list(pending)
-        else:
-            try:
-                if error_info is not None:
-                    raise RPCMethodException(error_info)
-                done.pop().result()  # raise exception
-                return response + (pending,)
-            except ClientOSError:
-                raise RequestError()
 
-    return result, status, headers, pending
+def _discard_result(future):
+    if not future.cancelled():
+        future.exception()
 
 
 def session_decorator(func):
     @asyncio.coroutine
-    def session_post(self, data=None, headers=None, patch=None):
-        futures = list()
-
-        yield from self.try_clear()
+    def session_post(self, data=None, headers=None, patch=None, request=None, deadline=None):
+        def call(interface):
+            return self._tracked(interface, func(
+                self,
+                url=self._url(interface, patch or self.patch),
+                session=self.get_session(interface),
+                data=data,
+                headers=self._timeout_headers(headers, deadline)
+            ), deadline)
 
-        if not self.sessions:
-            connector = aiohttp.TCPConnector(
-                loop=self.loop, ssl_context=self.ssl_context, limit=self.limit
-            )
-            self.sessions.append(aiohttp.ClientSession(connector=connector))
-
-        for ip_addr, port in self.interfaces_info:
-            futures.append(
-                func(
-                    self,
-                    url='{}/{}'.format(self.url_mask.format(ip_addr, port), patch or self.patch),
-                    session=self.sessions[-1],
-                    data=data,
-                    headers=headers
-                )
-            )
         try:
-            result, status, headers, pending = yield from wait_first_completed(futures)
+            if self.balancer is not None:
+                balanced = self._balanced(call, request)
+                if deadline is not None:
+                    balanced = asyncio.wait_for(balanced, deadline - self.loop.time())
+                result, status, headers = yield from balanced
+                if status == 500:
+                    raise RPCMethodException(result)
+                pending = ()
+            else:
+                if self.hedge_delay is None:
+                    futures = [call(interface) for interface in self.health.filter(self.interfaces_info)]
+                else:
+                    futures = yield from self._hedge(call)
+                result, status, headers, pending = yield from wait_first_completed(futures, deadline)
         except RPCMethodException as error_data:
-            for session in self.sessions:
-                yield from session.close()
-            self.sessions.clear()
-            error = deserialize(error_data.value)
+            error = self.codec.loads(error_data.value)
             raise RPCMethodException(error['error'])
         except RequestError:
-            for session in self.sessions:
-                yield from session.close()
-            self.sessions.clear()
             raise RPCMethodException('RequestError')
 
+        # Cancelled requests would close their connections, so the responses
+        # of the other interfaces are read and released in the background
         for f in pending:
-            f.cancel()
+            f.add_done_callback(_discard_result)
 
         return result, status, headers
     return session_post
 
 
+class WebSocketConnection:
+    """A websocket shared by all in-flight requests to one interface.
+
+    Responses are matched back to their requests by JSON-RPC id.
+    """
+
+    def __init__(self, ws, loop, codec):
+        self.ws = ws
+        self.codec = codec
+        self.waiters = dict()
+        self.reader = loop.create_task(self.read())
+
+    @property
+    def closed(self):
+        return self.ws.closed or self.reader.done()
+
+    @asyncio.coroutine
+    def read(self):
+        try:
+            while True:
+                msg = yield from self.ws.receive()
+                if msg.type == aiohttp.WSMsgType.BINARY:
+                    data = msg.data
+                elif msg.type == aiohttp.WSMsgType.TEXT:
+                    data = msg.data.encode()
+                else:
+                    break
+
+                response = self.codec.loads(data)
+                if isinstance(response, list):
+                    # Every response of a batch is passed to its own waiter
+                    for respond in response:
+                        self._resolve(respond, self.codec.dumps(respond))
+                else:
+                    self._resolve(response, data)
+        finally:
+            waiters, self.waiters = self.waiters, dict()
+            for future in waiters.values():
+                if not future.done():
+                    future.set_exception(ClientOSError('Websocket is closed'))
+
+    def _resolve(self, response, data):
+        if not isinstance(response, dict):
+            return
+        future = self.waiters.pop(response.get('id'), None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    @asyncio.coroutine
+    def send(self, request_id, data):
+        future = asyncio.Future()
+        self.waiters[request_id] = future
+        try:
+            yield from self.ws.send_bytes(data)
+            return (yield from future)
+        finally:
+            self.waiters.pop(request_id, None)
+
+    @asyncio.coroutine
+    def close(self):
+        yield from self.ws.close()
+        yield from asyncio.wait([self.reader])
+
+
+class Batch(ContextManagerMixin):
+    """Collects calls and sends them as one JSON-RPC batch on close.
+
+    Every call returns a future which is resolved once the batch is sent.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = list()
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.add(name, *args, **kwargs)
+
+    def add(self, method_name, *args, **kwargs):
+        future = asyncio.Future(loop=self.client.loop)
+        self.calls.append((_create_request(method_name, *args, **kwargs), future))
+        return future
+
+    @asyncio.coroutine
+    def close(self):
+        calls, self.calls = self.calls, list()
+        if not calls:
+            return
+
+        try:
+            data, headers = yield from self.client._encode(
+                self.client.codec.dumps([request for request, _ in calls])
+            )
+            data, _, headers = yield from self.client.session_post(
+                data=data, headers=headers, deadline=self.client._deadline()
+            )
+            response = get_codec(headers.get('Content-Type')).loads(data)
+            if not isinstance(response, list):
+                raise RPCMethodException(response['error'])
+            responses = {respond['id']: respond for respond in response}
+        except Exception as error:
+            for _, future in calls:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for request, future in calls:
+            if future.done():
+                continue
+            respond = responses.get(request['id'])
+            if respond is None:
+                future.set_exception(RPCMethodException('Response is missing'))
+            elif 'error' in respond:
+                future.set_exception(RPCMethodException(respond['error']))
+            else:
+                future.set_result(respond['result'])
+
+
+class Stream(ContextManagerMixin):
+    """Async iterator over the items of a streamed result.
+
+    The call goes to one interface; items are yielded as they arrive. An
+    item may take up to ``max_item_size`` bytes of the body.
+    """
+    max_item_size = 64 << 20
+
+    def __init__(self, client, request):
+        self.client = client
+        self.request = request
+        self.codec = get_codec()
+        self.response = None
+        self.buffer = bytearray()
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        if self.response is None:
+            yield from self._open()
+
+        line = yield from self._readline()
+        if not line:
+            yield from self.close()
+            raise StopAsyncIteration
+
+        item = self.codec.loads(line)
+        if 'error' in item:
+            yield from self.close()
+            raise RPCMethodException(item['error'])
+        return item['result']
+
+    @asyncio.coroutine
+    def _readline(self):
+        # StreamReader.readline() fails on lines longer than its buffer limit
+        start = 0
+        while True:
+            end = self.buffer.find(b'\n', start)
+            if end >= 0:
+                line = bytes(self.buffer[:end + 1])
+                del self.buffer[:end + 1]
+                return line
+            if len(self.buffer) > self.max_item_size:
+                yield from self.close()
+                raise ValueError('Streamed item is longer than {} bytes'.format(self.max_item_size))
+            start = len(self.buffer)
+            chunk = yield from self.response.content.readany()
+            if not chunk:
+                line = bytes(self.buffer)
+                self.buffer.clear()
+                return line
+            self.buffer += chunk
+
+    @asyncio.coroutine
+    def _open(self):
+        client = self.client
+        data = client.codec.dumps(self.request)
+        headers = dict(client.headers, Accept=STREAM)
+
+        interfaces = client.health.filter(client.interfaces_info)
+        if client.balancer is None:
+            interfaces = client.latency.order(interfaces)
+        while interfaces:
+            interface = interfaces[0] if client.balancer is None else client.balancer.choose(interfaces, self.request)
+            url = client._url(interface, client.patch)
+            try:
+                self.response = yield from client._tracked(
+                    interface, client.get_session(interface).post(url=url, data=data, headers=headers)
+                )
+                break
+            except ClientOSError:
+                interfaces.remove(interface)
+        else:
+            raise RPCMethodException('RequestError')
+
+        if self.response.content_type != STREAM:
+            # Errors are answered with a plain response
+            data = yield from self.response.read()
+            yield from self.close()
+            response = get_codec(self.response.content_type).loads(data)
+            raise RPCMethodException(response['error'])
+
+    @asyncio.coroutine
+    def close(self):
+        if self.response is not None:
+            yield from self.response.release()
+
+
+class Timeout:
+    """Calls methods of the client which fail after timeout seconds."""
+
+    def __init__(self, client, timeout):
+        self.client = client
+        self.timeout = timeout
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.client._async_call(name, args, kwargs, self.timeout)
+
+
+def _params(args, kwargs):
+    # Positional params are a list, as if they were decoded from JSON
+    return list(args) or kwargs
+
+
+class LocalClient(ContextManagerMixin):
+    """Calls methods of a UniCastServer running in the same loop.
+
+    Calls go to the server's method table directly: there are no sockets,
+    no serialization and no deduplication, so params and results are passed
+    as they are. Admission limits and metrics of the server apply.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self._call(name, _params(args, kwargs))
+
+    def _call_method(self, method_name, params):
+        server = self.server
+        request = dict(jsonrpc='2.0', method=method_name, params=params)
+        return _call_method(
+            server.obj, server.storage, server.methods, request, server.metrics, admission=server.admission
+        )
+
+    @asyncio.coroutine
+    def _call(self, method_name, params):
+        response, _ = yield from self._call_method(method_name, params)
+        if 'error' in response:
+            raise RPCMethodException(response['error'])
+        return response['result']
+
+    @asyncio.coroutine
+    def notify(self, method_name, *args, **kwargs):
+        _run_in_background(self._call_method(method_name, _params(args, kwargs)))
+
+    @asyncio.coroutine
+    def close(self):
+        pass
+
+
 class UniCastClient(ContextManagerMixin):
     _closing = False
 
     def __init__(self, interfaces_info, patch='post', limit=20, loop=None, url_mask=None,
-                 certfile=None, keyfile=None, **kwargs):
+                 limit_per_host=0, keepalive_timeout=15,
+                 certfile=None, keyfile=None, coalesce=False, ws_patch=None, content_type=None,
+                 hedge_delay=None, balancer=None, health=None, compression=None, content_encoding='gzip',
+                 timeout=None, cache=None, **kwargs):
         self.interfaces_info = interfaces_info
         self.patch = patch
 
@@ -194,14 +481,57 @@ class UniCastClient(ContextManagerMixin):
 
         self.url_mask = url_mask or 'http://{}:{}'
 
-        self.sessions = deque()
+        # One long-lived pool of keep-alive connections is shared by all calls.
+        # Idle connections are closed after keepalive_timeout seconds.
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.session = None
 
-        self.__start_ts = None
-        self.__finish_ts = None
-        self.monitoring_timeout = 5
+        # Interfaces with port None are paths of Unix sockets, each of them
+        # gets its own pool of connections.
+        self.unix_sessions = dict()
 
         self._req_counter = LockCounter()
 
+        self.codec = get_codec(content_type)
+        self.encoder = RequestEncoder(self.codec)
+        self.headers = {
+            'Content-Type': self.codec.content_type,
+            'Accept': self.codec.content_type,
+            'Accept-Encoding': accept_encoding()
+        }
+
+        # Request bodies are compressed with content_encoding when compression
+        # (an asyncrpc.compression.Compression) is set.
+        self.compression = compression
+        self.compressor = compressors[content_encoding] if compression is not None else None
+
+        self.coalesce = coalesce
+        self._coalesced = None
+
+        # Calls fail with asyncio.TimeoutError after timeout seconds. The
+        # remaining time is sent to servers, which cancel calls nobody waits for.
+        self.timeout = timeout
+
+        # An asyncrpc.cache.ResponseCache for results of idempotent methods
+        self.cache = cache
+
+        self.stats = Metrics(prefix='asyncrpc_client')
+
+        # None sends every call to all interfaces at once. Otherwise a call
+        # goes to the fastest interface first and to the others only after
+        # hedge_delay seconds; 'auto' waits for about the interface's p95.
+        self.hedge_delay = hedge_delay
+        self.latency = LatencyTracker()
+
+        # A balancer sends every call to one interface and retries the next
+        # one on connection errors; it takes precedence over hedging.
+        self.balancer = balancer
+        self.health = health or EndpointHealth()
+
+        self.ws_patch = ws_patch
+        self.ws_connections = dict()
+
         self.ssl_context = None
         if certfile and keyfile:
             self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
@@ -209,17 +539,170 @@ class UniCastClient(ContextManagerMixin):
             self.url_mask = url_mask or 'https://{}:{}'
 
     def __getattr__(self, name):
-        return lambda *args, **kwargs: self._async_call(name, *args, **kwargs)
+        return lambda *args, **kwargs: self._async_call(name, args, kwargs)
+
+    def with_timeout(self, timeout):
+        """Returns a proxy calling methods with their own timeout."""
+        return Timeout(self, timeout)
+
+    def batch(self):
+        return Batch(self)
+
+    @asyncio.coroutine
+    def notify(self, method_name, *args, **kwargs):
+        """Calls a method without waiting for it to be executed.
+
+        Notifications are not deduplicated by servers, so one is sent to one
+        interface only. Returns once the server has accepted it.
+        """
+        request = dict(jsonrpc='2.0', method=method_name, params=args or kwargs)
+        data, headers = yield from self._encode(self.codec.dumps(request))
+
+        interfaces = self.health.filter(self.interfaces_info)
+        if self.balancer is None:
+            interfaces = self.latency.order(interfaces)
+        while interfaces:
+            interface = interfaces[0] if self.balancer is None else self.balancer.choose(interfaces, request)
+            url = self._url(interface, self.patch)
+            try:
+                _, status, _ = yield from self._tracked(
+                    interface, self.request(self.get_session(interface).post(url=url, data=data, headers=headers))
+                )
+            except ClientOSError:
+                interfaces.remove(interface)
+                continue
+            if status != 204:
+                raise RPCMethodException('Notification was rejected with status {}'.format(status))
+            return
+        raise RPCMethodException('RequestError')
+
+    def stream(self, method_name, *args, **kwargs):
+        return Stream(self, _create_request(method_name, *args, **kwargs))
+
+    def _flush_coalesced(self):
+        batch, self._coalesced = self._coalesced, None
+        if batch is not None:
+            self.loop.create_task(batch.close())
 
     @asyncio.coroutine
-    def _async_call(self, method_name, *args, **kwargs):
-        request = create_request(method_name, *args, **kwargs)
-        data, _, _ = yield from self.session_post(data=request)
-        response = deserialize(data)
+    def _async_call(self, method_name, args, kwargs, timeout=None):
+        start_ts = self.stats.start(method_name)
+        status = 500
+        try:
+            if self.cache is None:
+                result = yield from self._call(method_name, args, kwargs, timeout)
+            else:
+                result = yield from self.cache.call(
+                    method_name, args or kwargs, partial(self._call, method_name, args, kwargs, timeout),
+                    self.timeout if timeout is None else timeout
+                )
+            status = 200
+            return result
+        finally:
+            self.stats.finish(method_name, status, start_ts)
+
+    @asyncio.coroutine
+    def _call(self, method_name, args, kwargs, timeout=None):
+        deadline = self._deadline(timeout)
+        if self.coalesce:
+            # Calls issued in the same loop iteration are sent as one batch.
+            if self._coalesced is None:
+                self._coalesced = Batch(self)
+                self.loop.call_soon(self._flush_coalesced)
+            future = self._coalesced.add(method_name, *args, **kwargs)
+            if deadline is not None:
+                future = asyncio.wait_for(future, deadline - self.loop.time())
+            return (yield from future)
+
+        request_id, params = generate_id(), args or kwargs
+        data = self.encoder.encode(method_name, params, request_id)
+        if self.ws_patch is not None:
+            data = yield from self.ws_post(request_id, data, deadline)
+            codec = self.codec
+        else:
+            # Only balancers route by the request
+            request = None
+            if self.balancer is not None:
+                request = dict(jsonrpc='2.0', method=method_name, params=params, id=request_id)
+            data, headers = yield from self._encode(data)
+            data, _, headers = yield from self.session_post(
+                data=data, headers=headers, request=request, deadline=deadline
+            )
+            codec = get_codec(headers.get('Content-Type'))
+        response = codec.loads(data)
         if 'error' in response:
             raise RPCMethodException(response['error'])
         return response['result']
 
+    def _deadline(self, timeout=None):
+        """Returns the loop time by which a call started now must complete."""
+        timeout = self.timeout if timeout is None else timeout
+        return None if timeout is None else self.loop.time() + timeout
+
+    def _timeout_headers(self, headers, deadline):
+        if deadline is None:
+            return headers
+        timeout = max(deadline - self.loop.time(), 0)
+        return dict(headers, **{TIMEOUT_HEADER: '{:.3f}'.format(timeout)})
+
+    @asyncio.coroutine
+    def _encode(self, data):
+        """Returns the request body and its headers."""
+        if self.compression is None:
+            return data, self.headers
+        data, encoding = yield from self.compression.compress(self.compressor, data)
+        if encoding is None:
+            return data, self.headers
+        return data, dict(self.headers, **{'Content-Encoding': encoding})
+
+    @asyncio.coroutine
+    def _tracked(self, interface, coro, deadline=None):
+        start_ts = time.perf_counter()
+        self.health.attempt(interface)
+        try:
+            response = yield from coro
+        except (ClientOSError, asyncio.TimeoutError):
+            self.health.failure(interface)
+            raise
+        except asyncio.CancelledError:
+            # Calls are cancelled once their deadline passes
+            if deadline is not None and self.loop.time() >= deadline - DEADLINE_SLACK:
+                self.health.failure(interface)
+            else:
+                self.health.abandon(interface)
+            raise
+        self.health.success(interface)
+        self.latency.observe(interface, time.perf_counter() - start_ts)
+        return response
+
+    @asyncio.coroutine
+    def _balanced(self, call, request):
+        interfaces = self.health.filter(self.interfaces_info)
+        while interfaces:
+            interface = self.balancer.choose(interfaces, request)
+            self.balancer.acquire(interface)
+            try:
+                return (yield from call(interface))
+            except ClientOSError:
+                interfaces.remove(interface)
+            finally:
+                self.balancer.release(interface)
+        raise RequestError()
+
+    @asyncio.coroutine
+    def _hedge(self, call):
+        interfaces = self.latency.order(self.health.filter(self.interfaces_info))
+        first = asyncio.ensure_future(call(interfaces[0]))
+
+        if self.hedge_delay == 'auto':
+            delay = self.latency.threshold(interfaces[0])
+        else:
+            delay = self.hedge_delay
+        done, _ = yield from asyncio.wait([first], timeout=delay)
+        if done and first.exception() is None and first.result()[1] == 200:
+            return [first]
+        return [first] + [call(interface) for interface in interfaces[1:]]
+
     @asyncio.coroutine
     def request(self, f):
         if self._closing:
@@ -228,7 +711,13 @@ class UniCastClient(ContextManagerMixin):
         with self._req_counter:
             resp = yield from f
             try:
-                return (yield from resp.read()), resp.status, resp.headers
+                data = yield from resp.read()
+                encoding = resp.headers.get('Content-Encoding')
+                if self.compression is not None:
+                    data = yield from self.compression.decompress(data, encoding)
+                else:
+                    data = yield from decompress_offloaded(data, encoding)
+                return data, resp.status, resp.headers
             finally:
                 yield from resp.release()
 
@@ -250,31 +739,104 @@ class UniCastClient(ContextManagerMixin):
             yield from self.request(session.get(url=url, headers=headers))
         )
 
+    def _url(self, interface, patch):
+        ip_addr, port = interface
+        if port is None:
+            # The host is not used to connect to a Unix socket
+            return 'http://localhost/{}'.format(patch)
+        return '{}/{}'.format(self.url_mask.format(ip_addr, port), patch)
+
+    def get_session(self, interface=None):
+        if interface is not None and interface[1] is None:
+            return self._unix_session(interface[0])
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                loop=self.loop, ssl_context=self.ssl_context, limit=self.limit,
+                limit_per_host=self.limit_per_host, keepalive_timeout=self.keepalive_timeout,
+                enable_cleanup_closed=self.ssl_context is not None
+            )
+            # Responses are decoded by request(), large ones in an executor
+            self.session = aiohttp.ClientSession(connector=connector, auto_decompress=False)
+        return self.session
+
+    def _unix_session(self, path):
+        session = self.unix_sessions.get(path)
+        if session is None or session.closed:
+            connector = aiohttp.UnixConnector(
+                path=path, loop=self.loop, limit=self.limit, keepalive_timeout=self.keepalive_timeout
+            )
+            session = aiohttp.ClientSession(connector=connector, auto_decompress=False)
+            self.unix_sessions[path] = session
+        return session
+
     @asyncio.coroutine
-    def close(self):
-        self._closing = True
-        yield from self._req_counter.wait()
-        for session in self.sessions:
-            yield from session.close()
-        self.sessions.clear()
+    def _ws_connect(self, interface):
+        ws = yield from self.get_session(interface).ws_connect(
+            self._url(interface, self.ws_patch), headers={'Accept': self.codec.content_type}
+        )
+        return WebSocketConnection(ws, self.loop, self.codec)
+
+    @staticmethod
+    def _ws_alive(connecting):
+        if connecting.cancelled() or connecting.exception() is not None:
+            return False
+        return not connecting.result().closed
 
     @asyncio.coroutine
-    def try_clear(self):
-        if self.__start_ts is None:
-            self.__start_ts = time.perf_counter()
-            return
+    def ws_send(self, interface, request_id, data):
+        if self._closing:
+            raise asyncio.CancelledError
 
-        if time.perf_counter() - self.__start_ts > self.monitoring_timeout and self.__finish_ts is None:
-            self.__finish_ts = time.perf_counter()
+        connecting = self.ws_connections.get(interface)
+        if connecting is None or (connecting.done() and not self._ws_alive(connecting)):
+            connecting = self.loop.create_task(self._ws_connect(interface))
+            self.ws_connections[interface] = connecting
 
-            connector = aiohttp.TCPConnector(loop=self.loop, ssl_context=self.ssl_context, limit=self.limit)
-            self.sessions.append(aiohttp.ClientSession(connector=connector))
-            return
+        with self._req_counter:
+            connection = yield from asyncio.shield(connecting)
+            return (yield from connection.send(request_id, data))
 
-        if self.__finish_ts and time.perf_counter() - self.__finish_ts > self.monitoring_timeout:
-            if len(self.sessions) > 1:
-                session = self.sessions.popleft()
-                yield from session.close()
-            self.__start_ts = None
-            self.__finish_ts = None
-            return
+    @asyncio.coroutine
+    def ws_post(self, request_id, data, deadline=None):
+        # Every interface answers with the response of the copy which executed
+        # the request, so the first response is the result whatever it contains.
+        pending = [
+            asyncio.ensure_future(self.ws_send(interface, request_id, data))
+            for interface in self.interfaces_info
+        ]
+        try:
+            while pending:
+                timeout = None if deadline is None else deadline - self.loop.time()
+                done, pending = yield from asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED, timeout=timeout
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for f in done:
+                    if f.exception() is None:
+                        return f.result()
+            raise RPCMethodException('RequestError')
+        finally:
+            for f in pending:
+                f.cancel()
+
+    @asyncio.coroutine
+    def close(self):
+        if self._coalesced is not None:
+            batch, self._coalesced = self._coalesced, None
+            yield from batch.close()
+        self._closing = True
+        yield from self._req_counter.wait()
+
+        connections, self.ws_connections = self.ws_connections, dict()
+        for connecting in connections.values():
+            if connecting.done() and self._ws_alive(connecting):
+                yield from connecting.result().close()
+            else:
+                connecting.cancel()
+        if self.session is not None:
+            yield from self.session.close()
+            self.session = None
+        sessions, self.unix_sessions = self.unix_sessions, dict()
+        for session in sessions.values():
+            yield from session.close()
@@ -0,0 +1,142 @@
+import json
+import struct
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+FRAMES = 'application/x-asyncrpc-frames'
+
+
+class JSONCodec:
+    content_type = JSON
+
+    def dumps(self, value):
+        return json.dumps(value).encode()
+
+    def loads(self, data):
+        return json.loads(data.decode())
+
+
+class ORJSONCodec(JSONCodec):
+
+    def dumps(self, value):
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            # orjson is stricter than json (e.g. non-string keys, big integers)
+            return super().dumps(value)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class MsgPackCodec:
+    content_type = MSGPACK
+
+    def dumps(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class FramesCodec:
+    """JSON with bytes-like values sent as out-of-band binary attachments.
+
+    The body is a 4-byte big-endian header length, a JSON header and the
+    attachments one after another. In the header every attachment is
+    replaced with ``{"$attachment": index}`` and the header ends with the
+    attachment lengths. Decoded attachments are memoryviews of the received
+    body, so they are not copied. Keys of user objects which look like the
+    reserved key get one more ``$``, e.g. ``$$attachment``.
+    """
+    content_type = FRAMES
+    key = '$attachment'
+
+    def _escape(self, k):
+        return '$' + k if isinstance(k, str) and k.startswith('$') and k.lstrip('$') == self.key[1:] else k
+
+    def _unescape(self, k):
+        return k[1:] if isinstance(k, str) and k.startswith('$$') and k.lstrip('$') == self.key[1:] else k
+
+    def _extract(self, value, attachments):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            attachments.append(value)
+            return {self.key: len(attachments) - 1}
+        if isinstance(value, dict):
+            return {self._escape(k): self._extract(v, attachments) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._extract(v, attachments) for v in value]
+        return value
+
+    def _insert(self, value, attachments):
+        if isinstance(value, dict):
+            if len(value) == 1 and self.key in value:
+                return attachments[value[self.key]]
+            return {self._unescape(k): self._insert(v, attachments) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._insert(v, attachments) for v in value]
+        return value
+
+    def dumps(self, value):
+        attachments = list()
+        value = self._extract(value, attachments)
+        header = codecs[JSON].dumps([value, [memoryview(a).nbytes for a in attachments]])
+        return b''.join([struct.pack('>I', len(header)), header] + attachments)
+
+    def loads(self, data):
+        view = memoryview(data)
+        size, = struct.unpack_from('>I', view)
+        offset = 4 + size
+        value, lengths = codecs[JSON].loads(bytes(view[4:offset]))
+
+        attachments = list()
+        for length in lengths:
+            attachments.append(view[offset:offset + length])
+            offset += length
+        return self._insert(value, attachments)
+
+
+codecs = dict()
+
+
+def register(codec):
+    codecs[codec.content_type] = codec
+
+
+def _media_type(content_type):
+    return content_type.split(';', 1)[0].strip().lower()
+
+
+def get_codec(content_type=None):
+    if content_type:
+        codec = codecs.get(_media_type(content_type))
+        if codec is not None:
+            return codec
+    return codecs[JSON]
+
+
+def negotiate(accept, default=None):
+    """Returns the first registered codec listed in an Accept header."""
+    if accept:
+        for content_type in accept.split(','):
+            codec = codecs.get(_media_type(content_type))
+            if codec is not None:
+                return codec
+    return default or codecs[JSON]
+
+
+register(JSONCodec() if orjson is None else ORJSONCodec())
+register(FramesCodec())
+if msgpack is not None:
+    register(MsgPackCodec())
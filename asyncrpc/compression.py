@@ -0,0 +1,117 @@
+import gzip
+import zlib
+import asyncio
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+
+# aiohttp's server decodes these request encodings itself, while they are
+# received; the client decodes every response encoding with compressors
+NATIVE = ('gzip', 'deflate')
+
+# Bodies of at least this many bytes are (de)compressed in an executor
+OFFLOAD_THRESHOLD = 1 << 20
+
+
+class Compressor:
+
+    def __init__(self, name, compress, decompress):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+
+compressors = dict()
+
+
+def register(compressor):
+    compressors[compressor.name] = compressor
+
+
+def negotiate(accept_encoding):
+    """Returns the first registered compressor listed in Accept-Encoding."""
+    if accept_encoding:
+        for encoding in accept_encoding.split(','):
+            encoding, _, params = encoding.partition(';')
+            if params.strip().replace(' ', '') in ('q=0', 'q=0.0'):
+                continue
+            compressor = compressors.get(encoding.strip().lower())
+            if compressor is not None:
+                return compressor
+    return None
+
+
+def accept_encoding():
+    return ', '.join(compressors)
+
+
+def decompress(data, encoding):
+    if not encoding:
+        return data
+    compressor = compressors.get(encoding)
+    if compressor is None:
+        raise ValueError('Content encoding {} is not supported'.format(encoding))
+    return compressor.decompress(data)
+
+
+@asyncio.coroutine
+def decompress_offloaded(data, encoding, offload_threshold=OFFLOAD_THRESHOLD):
+    """Like decompress(), in the loop's default executor for large bodies."""
+    if not encoding or len(data) < offload_threshold:
+        return decompress(data, encoding)
+    loop = asyncio.get_event_loop()
+    return (yield from loop.run_in_executor(None, decompress, data, encoding))
+
+
+class Compression:
+    """Compresses bodies of at least ``threshold`` bytes.
+
+    Bodies of at least ``offload_threshold`` bytes are compressed and
+    decompressed in the loop's default executor to keep the loop responsive.
+    """
+
+    def __init__(self, threshold=1024, offload_threshold=OFFLOAD_THRESHOLD):
+        self.threshold = threshold
+        self.offload_threshold = offload_threshold
+
+    @asyncio.coroutine
+    def compress(self, compressor, data):
+        """Returns the data and its encoding, None if it was not compressed."""
+        if compressor is None or len(data) < self.threshold:
+            return data, None
+        if len(data) < self.offload_threshold:
+            return compressor.compress(data), compressor.name
+        loop = asyncio.get_event_loop()
+        return (yield from loop.run_in_executor(None, compressor.compress, data)), compressor.name
+
+    @asyncio.coroutine
+    def decompress(self, data, encoding):
+        return (yield from decompress_offloaded(data, encoding, self.offload_threshold))
+
+
+def _inflate(data):
+    # Servers send deflate either with or without the zlib header
+    try:
+        return zlib.decompress(data)
+    except zlib.error:
+        return zlib.decompress(data, -zlib.MAX_WBITS)
+
+
+if zstandard is not None:
+    register(Compressor(
+        'zstd',
+        lambda data: zstandard.ZstdCompressor().compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    ))
+if lz4 is not None:
+    register(Compressor('lz4', lz4.frame.compress, lz4.frame.decompress))
+register(Compressor('gzip', gzip.compress, gzip.decompress))
+register(Compressor('deflate', zlib.compress, _inflate))
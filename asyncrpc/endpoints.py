@@ -0,0 +1,173 @@
+import abc
+import time
+import zlib
+import bisect
+import random
+import itertools
+from collections import defaultdict
+
+
+class LatencyTracker:
+    """Exponentially weighted moving average of latency per endpoint.
+
+    Endpoints which were never observed count as the fastest, so they get
+    probed first.
+    """
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.mean = dict()
+        self.deviation = dict()
+
+    def observe(self, endpoint, latency):
+        mean = self.mean.get(endpoint)
+        if mean is None:
+            self.mean[endpoint] = latency
+            self.deviation[endpoint] = latency / 2
+            return
+
+        self.deviation[endpoint] += self.alpha * (abs(latency - mean) - self.deviation[endpoint])
+        self.mean[endpoint] = mean + self.alpha * (latency - mean)
+
+    def get(self, endpoint):
+        return self.mean.get(endpoint, 0)
+
+    def threshold(self, endpoint, k=2):
+        """Latency above which a call to the endpoint counts as slow.
+
+        The mean plus two mean deviations is roughly the 95th percentile.
+        """
+        return self.mean.get(endpoint, 0) + k * self.deviation.get(endpoint, 0)
+
+    def order(self, endpoints):
+        return sorted(endpoints, key=self.get)
+
+
+class EndpointHealth:
+    """Passive health checks with a circuit breaker per endpoint.
+
+    After ``max_failures`` consecutive failures, connection errors or
+    timeouts, an endpoint is skipped for ``reprobe_timeout`` seconds. Then
+    it gets one probe request: a success closes the circuit, and a failure
+    opens it again. A probe which is not answered within ``reprobe_timeout``
+    seconds is replaced by another one.
+    """
+
+    def __init__(self, max_failures=3, reprobe_timeout=5):
+        self.max_failures = max_failures
+        self.reprobe_timeout = reprobe_timeout
+        self.failures = dict()
+        self.open_until = dict()
+        self.probes = dict()
+
+    def available(self, endpoint):
+        open_until = self.open_until.get(endpoint)
+        if open_until is None:
+            return True
+        now = time.perf_counter()
+        return open_until <= now and self.probes.get(endpoint, 0) <= now
+
+    def attempt(self, endpoint):
+        """Marks a request sent to an endpoint with an open circuit as its probe."""
+        if endpoint in self.open_until:
+            self.probes[endpoint] = time.perf_counter() + self.reprobe_timeout
+
+    def abandon(self, endpoint):
+        """Lets another probe through after a request was cancelled."""
+        self.probes.pop(endpoint, None)
+
+    def filter(self, endpoints):
+        """Returns available endpoints, or all of them if none is available."""
+        return [endpoint for endpoint in endpoints if self.available(endpoint)] or list(endpoints)
+
+    def success(self, endpoint):
+        self.failures.pop(endpoint, None)
+        self.open_until.pop(endpoint, None)
+        self.probes.pop(endpoint, None)
+
+    def failure(self, endpoint):
+        self.probes.pop(endpoint, None)
+        failures = self.failures.get(endpoint, 0) + 1
+        self.failures[endpoint] = failures
+        if failures >= self.max_failures:
+            self.open_until[endpoint] = time.perf_counter() + self.reprobe_timeout
+
+
+class Balancer(abc.ABC):
+    """Chooses one endpoint per call instead of broadcasting to all of them."""
+
+    def __init__(self):
+        self.outstanding = defaultdict(int)
+
+    def acquire(self, endpoint):
+        self.outstanding[endpoint] += 1
+
+    def release(self, endpoint):
+        self.outstanding[endpoint] -= 1
+
+    @abc.abstractmethod
+    def choose(self, endpoints, request=None):
+        """Returns one of the endpoints for the request."""
+
+
+class RoundRobinBalancer(Balancer):
+
+    def __init__(self):
+        super().__init__()
+        self.counter = itertools.count()
+
+    def choose(self, endpoints, request=None):
+        return endpoints[next(self.counter) % len(endpoints)]
+
+
+class LeastOutstandingBalancer(Balancer):
+
+    def choose(self, endpoints, request=None):
+        return min(endpoints, key=self.outstanding.__getitem__)
+
+
+class PowerOfTwoBalancer(Balancer):
+    """Picks the less loaded of two random endpoints."""
+
+    def choose(self, endpoints, request=None):
+        if len(endpoints) < 2:
+            return endpoints[0]
+        first, second = random.sample(endpoints, 2)
+        return first if self.outstanding[first] <= self.outstanding[second] else second
+
+
+def _method_key(request):
+    return request['method'] if request else ''
+
+
+class ConsistentHashBalancer(Balancer):
+    """Sends calls with the same key to the same endpoint.
+
+    ``key`` maps a request dict to a string, the method name by default.
+    """
+
+    def __init__(self, key=_method_key, replicas=100):
+        super().__init__()
+        self.key = key
+        self.replicas = replicas
+        self.rings = dict()
+
+    @staticmethod
+    def _hash(value):
+        return zlib.crc32(value.encode())
+
+    def _ring(self, endpoints):
+        endpoints = tuple(endpoints)
+        ring = self.rings.get(endpoints)
+        if ring is None:
+            points = sorted(
+                (self._hash('{}-{}'.format(endpoint, replica)), endpoint)
+                for endpoint in endpoints for replica in range(self.replicas)
+            )
+            ring = self.rings[endpoints] = [point for point, _ in points], [endpoint for _, endpoint in points]
+        return ring
+
+    def choose(self, endpoints, request=None):
+        points, ring_endpoints = self._ring(endpoints)
+        index = bisect.bisect(points, self._hash(self.key(request))) % len(points)
+        return ring_endpoints[index]
@@ -0,0 +1,116 @@
+import inspect
+
+from asyncrpc.cache import ResponseCache
+
+
+SYNC = 'sync'
+COROUTINE = 'coroutine'
+NATIVE = 'native'
+ASYNCGEN = 'asyncgen'
+EXECUTOR = 'executor'
+
+# Calls of these kinds return awaitables
+AWAITABLE = (COROUTINE, NATIVE, EXECUTOR)
+
+
+# Native coroutines and async generators are missing on older Pythons
+_isnativefunction = getattr(inspect, 'iscoroutinefunction', lambda func: False)
+_isasyncgenfunction = getattr(inspect, 'isasyncgenfunction', lambda func: False)
+
+
+def get_kind(func):
+    if _isnativefunction(func):
+        return NATIVE
+    if _isasyncgenfunction(func):
+        return ASYNCGEN
+    # Generator functions are coroutines unless marked by returns_iterator,
+    # then their iterators are sent as lists or streamed
+    if inspect.isgeneratorfunction(func) and not getattr(func, 'rpc_iterator', False):
+        return COROUTINE
+    return SYNC
+
+
+def compile_validator(func):
+    """Returns a function which checks params against the signature of func.
+
+    The function returns an error message or None if params fit.
+    """
+    positional = list()
+    keyword = set()
+    required = set()
+    var_positional = var_keyword = False
+    for parameter in inspect.signature(func).parameters.values():
+        if parameter.kind == parameter.VAR_POSITIONAL:
+            var_positional = True
+            continue
+        if parameter.kind == parameter.VAR_KEYWORD:
+            var_keyword = True
+            continue
+        if parameter.kind != parameter.KEYWORD_ONLY:
+            positional.append(parameter.name)
+        if parameter.kind != parameter.POSITIONAL_ONLY:
+            keyword.add(parameter.name)
+        if parameter.default is parameter.empty:
+            required.add(parameter.name)
+
+    def validate(params):
+        if isinstance(params, dict):
+            unexpected = set() if var_keyword else params.keys() - keyword
+            if unexpected:
+                return 'Unexpected params {}'.format(', '.join(sorted(unexpected)))
+            missing = required - params.keys()
+        elif isinstance(params, list):
+            if len(params) > len(positional) and not var_positional:
+                return 'Expected at most {} params, got {}'.format(len(positional), len(params))
+            missing = required - set(positional[:len(params)])
+        else:
+            return 'Params must be an array or an object'
+        if missing:
+            return 'Missing params {}'.format(', '.join(sorted(missing)))
+        return None
+    return validate
+
+
+class Method:
+
+    __slots__ = ('call', 'kind', 'awaitable', 'validate', 'cache')
+
+    def __init__(self, call, kind=None, validate=None, cache=None):
+        self.call = call
+        self.kind = get_kind(call) if kind is None else kind
+        self.awaitable = self.kind in AWAITABLE
+        self.validate = validate
+        self.cache = cache
+
+
+class MethodTable(dict):
+    """Maps method names to methods bound to obj.
+
+    It is built once, so a request resolves its method with one lookup.
+    ``functions`` maps names to functions of obj's class, public functions
+    of the class by default. ``wrap(name, func)`` may return a coroutine
+    function to call instead of func, e.g. to run func in an executor.
+
+    Concurrent calls of methods listed in ``coalesce`` with equal params
+    are executed once; ``coalesce`` maps their names to the seconds their
+    results are reused for, which may be 0.
+    """
+
+    def __init__(self, obj, functions=None, validate=False, wrap=None, coalesce=None):
+        super().__init__()
+        cache = ResponseCache(ttls=coalesce) if coalesce else None
+        if functions is None:
+            functions = {
+                name: func for name, func in inspect.getmembers(type(obj), inspect.isfunction)
+                if not name.startswith('_')
+            }
+
+        for name, func in functions.items():
+            call = func.__get__(obj)
+            validator = compile_validator(call) if validate else None
+            method_cache = cache if cache is not None and name in coalesce else None
+            wrapper = wrap(name, func) if wrap is not None else None
+            if wrapper is None:
+                self[name] = Method(call, validate=validator, cache=method_cache)
+            else:
+                self[name] = Method(wrapper.__get__(obj), EXECUTOR, validator, method_cache)
@@ -0,0 +1,110 @@
+import time
+import bisect
+import asyncio
+from collections import defaultdict
+
+from aiohttp import web
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for le, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield le, total
+
+
+class MethodStats:
+
+    def __init__(self):
+        self.calls = 0
+        self.in_flight = 0
+        self.statuses = defaultdict(int)
+        self.latency = Histogram()
+
+
+class Metrics:
+    """Per-method call counts, statuses, latencies and in-flight calls.
+
+    Used by UniCastServer for served requests and by UniCastClient for calls.
+    """
+
+    def __init__(self, storage=None, prefix='asyncrpc'):
+        self.methods = defaultdict(MethodStats)
+        self.storage = storage
+        self.prefix = prefix
+        # A Histogram of event loop lag, set by servers with a profiler
+        self.loop_lag = None
+
+    def start(self, method):
+        stats = self.methods[method]
+        stats.calls += 1
+        stats.in_flight += 1
+        return time.perf_counter()
+
+    def finish(self, method, status, start_ts):
+        stats = self.methods[method]
+        stats.in_flight -= 1
+        stats.statuses[status] += 1
+        stats.latency.observe(time.perf_counter() - start_ts)
+
+    def render(self):
+        """Returns the metrics in the Prometheus text format."""
+        lines = list()
+        name = self.prefix + '_calls_total'
+        lines.append('# TYPE {} counter'.format(name))
+        for method, stats in sorted(self.methods.items()):
+            lines.append('{}{{method="{}"}} {}'.format(name, method, stats.calls))
+
+        name = self.prefix + '_responses_total'
+        lines.append('# TYPE {} counter'.format(name))
+        for method, stats in sorted(self.methods.items()):
+            for status, count in sorted(stats.statuses.items()):
+                lines.append('{}{{method="{}",status="{}"}} {}'.format(name, method, status, count))
+
+        name = self.prefix + '_in_flight'
+        lines.append('# TYPE {} gauge'.format(name))
+        for method, stats in sorted(self.methods.items()):
+            lines.append('{}{{method="{}"}} {}'.format(name, method, stats.in_flight))
+
+        name = self.prefix + '_latency_seconds'
+        lines.append('# TYPE {} histogram'.format(name))
+        for method, stats in sorted(self.methods.items()):
+            for le, count in stats.latency.cumulative():
+                lines.append('{}_bucket{{method="{}",le="{}"}} {}'.format(name, method, le, count))
+            lines.append('{}_sum{{method="{}"}} {}'.format(name, method, stats.latency.sum))
+            lines.append('{}_count{{method="{}"}} {}'.format(name, method, stats.latency.count))
+
+        if self.storage is not None:
+            name = self.prefix + '_storage_size'
+            lines.append('# TYPE {} gauge'.format(name))
+            lines.append('{} {}'.format(name, len(self.storage)))
+
+        if self.loop_lag is not None:
+            name = self.prefix + '_loop_lag_seconds'
+            lines.append('# TYPE {} histogram'.format(name))
+            for le, count in self.loop_lag.cumulative():
+                lines.append('{}_bucket{{le="{}"}} {}'.format(name, le, count))
+            lines.append('{}_sum {}'.format(name, self.loop_lag.sum))
+            lines.append('{}_count {}'.format(name, self.loop_lag.count))
+        return '\n'.join(lines) + '\n'
+
+
+@asyncio.coroutine
+def get_metrics(metrics, request):
+    return web.Response(text=metrics.render(), content_type='text/plain')
@@ -0,0 +1,214 @@
+import io
+import time
+import pstats
+import asyncio
+import logging
+import cProfile
+from collections import deque
+
+from aiohttp import web
+
+from asyncrpc.metrics import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a task sleeping ``interval``.
+
+    Lag shows that something blocks the loop: a plain method, encoding of a
+    large response or a sweep of the storage.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.histogram = Histogram(LAG_BUCKETS)
+        self.last = 0
+        self.max = 0
+        self.task = None
+
+    def start(self, loop):
+        self.task = loop.create_task(self.run(loop))
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    @asyncio.coroutine
+    def run(self, loop):
+        while True:
+            start_ts = loop.time()
+            yield from asyncio.sleep(self.interval)
+            self.observe(max(loop.time() - start_ts - self.interval, 0))
+
+    def observe(self, lag):
+        self.histogram.observe(lag)
+        self.last = lag
+        self.max = max(self.max, lag)
+
+
+class CallTimer:
+    """Timings of the phases of one request, each since the previous mark."""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.phases = list()
+        self.start_ts = self.ts = time.perf_counter()
+
+    def mark(self, phase):
+        ts = time.perf_counter()
+        self.phases.append((phase, ts - self.ts))
+        self.ts = ts
+
+    def profile(self, method):
+        return self.profiler.profile(method)
+
+    def finish(self, method):
+        self.profiler.finish(self, method)
+
+
+class NullTimer:
+    """Stands for a CallTimer when the server has no profiler."""
+
+    def mark(self, phase):
+        pass
+
+    def profile(self, method):
+        return self
+
+    def finish(self, method):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class _Profiling:
+
+    def __init__(self, profiler, method):
+        self.profiler = profiler
+        self.method = method
+        self.profile = None
+
+    def __enter__(self):
+        if self.method in self.profiler.methods:
+            self.profile = self.profiler.profile_data
+            self.profiler.enable()
+
+    def __exit__(self, *args):
+        if self.profile is not None:
+            self.profiler.disable(self.profile)
+
+
+class Profiler:
+    """Slow-call log, loop lag monitor and cProfile of selected methods.
+
+    Requests taking ``slow_threshold`` seconds or longer are logged with the
+    timings of their phases, and the last ``max_slow_calls`` of them are
+    kept. cProfile runs while calls of the selected methods are executed;
+    as the loop runs other tasks meanwhile, they are profiled too.
+    """
+
+    def __init__(self, slow_threshold=1, lag_interval=0.1, max_slow_calls=100):
+        self.slow_threshold = slow_threshold
+        self.slow_calls = deque(maxlen=max_slow_calls)
+        self.lag = LoopLagMonitor(lag_interval)
+
+        self.methods = frozenset()
+        self.profile_data = None
+        self.active = 0
+
+    def timer(self):
+        return CallTimer(self)
+
+    def finish(self, timer, method):
+        total = time.perf_counter() - timer.start_ts
+        if total < self.slow_threshold:
+            return
+        phases = ', '.join('{}={:.4f}s'.format(phase, duration) for phase, duration in timer.phases)
+        self.slow_calls.append((method, total, phases))
+        logger.warning('Slow call of %s took %.4fs: %s', method, total, phases)
+
+    def start_profile(self, methods):
+        self.stop_profile()
+        self.methods = frozenset(methods)
+        self.profile_data = cProfile.Profile()
+
+    def stop_profile(self):
+        """Stops profiling and returns the collected profile, if any."""
+        profile, self.profile_data = self.profile_data, None
+        self.methods = frozenset()
+        if profile is not None and self.active:
+            profile.disable()
+        self.active = 0
+        return profile
+
+    def profile(self, method):
+        return _Profiling(self, method)
+
+    def enable(self):
+        # Calls of profiled methods overlap, one profile covers all of them
+        if self.active == 0:
+            self.profile_data.enable()
+        self.active += 1
+
+    def disable(self, profile):
+        if profile is not self.profile_data:
+            return
+        self.active -= 1
+        if self.active == 0:
+            profile.disable()
+
+    def report(self):
+        lines = [
+            'loop lag: last={:.4f}s max={:.4f}s mean={:.4f}s'.format(
+                self.lag.last, self.lag.max, self.lag.histogram.sum / (self.lag.histogram.count or 1)
+            ),
+            'profiled methods: {}'.format(', '.join(sorted(self.methods)) or '-'),
+            'slow calls:'
+        ]
+        for method, total, phases in self.slow_calls:
+            lines.append('  {} {:.4f}s {}'.format(method, total, phases))
+        return '\n'.join(lines) + '\n'
+
+
+def format_profile(profile, limit=50):
+    profile.create_stats()
+    if not profile.stats:
+        # pstats refuses a profile without any calls
+        return 'No calls were profiled\n'
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+@asyncio.coroutine
+def get_report(profiler, request):
+    return web.Response(text=profiler.report(), content_type='text/plain')
+
+
+@asyncio.coroutine
+def start_profile(profiler, request):
+    """Profiles the methods listed in the ``methods`` query parameter."""
+    methods = [method for method in request.query.get('methods', '').split(',') if method]
+    profiler.start_profile(methods)
+    return web.Response(text=profiler.report(), content_type='text/plain')
+
+
+@asyncio.coroutine
+def stop_profile(profiler, request):
+    """Stops profiling and returns the profile sorted by cumulative time."""
+    profile = profiler.stop_profile()
+    if profile is None:
+        return web.Response(text='Profiling is not started\n', status=404, content_type='text/plain')
+    return web.Response(text=format_profile(profile), content_type='text/plain')
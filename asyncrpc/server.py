@@ -1,34 +1,140 @@
+import os
 import ssl
+import signal
 import inspect
 import asyncio
-from functools import partial
+import multiprocessing
+from functools import partial, wraps
 
 from aiohttp import web
 
 from asyncrpc.utils import get_lst
-from asyncrpc.call import call_method, RequestsStorage
+from asyncrpc.methods import MethodTable, get_kind, SYNC
+from asyncrpc.metrics import Metrics, get_metrics
+from asyncrpc.profiling import get_report, start_profile, stop_profile
+from asyncrpc.call import call_method, call_ws, RequestsStorage
+
+
+def run_in_executor(pool=None, limit=None):
+    """Marks a method to be run in the UniCastServer's executor ``pool``.
+
+    ``pool`` is a key of ``UniCastServer.executors``; None means the loop's
+    default executor. ``limit`` bounds concurrent calls of the method.
+    """
+    def decorator(func):
+        func.rpc_executor = pool, limit
+        return func
+    return decorator
+
+
+def returns_iterator(func):
+    """Marks a generator method to be iterated instead of awaited.
+
+    Its items are sent as a list or streamed.
+    """
+    func.rpc_iterator = True
+    return func
+
+
+def offload_method(func, executor=None, limit=None):
+    semaphores = dict()
+
+    @asyncio.coroutine
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        loop = asyncio.get_event_loop()
+        call = partial(func, *args, **kwargs)
+        if not limit:
+            return (yield from loop.run_in_executor(executor, call))
+
+        # Semaphores are bound to a loop, and workers run their own loops
+        semaphore = semaphores.get(loop)
+        if semaphore is None:
+            semaphore = semaphores[loop] = asyncio.Semaphore(limit)
+        with (yield from semaphore):
+            return (yield from loop.run_in_executor(executor, call))
+    return wrapper
 
 
 class UniCastServer:
 
     def __init__(self, obj, ip_addrs, port, storage=RequestsStorage(), patch='/post', loop=None,
-                 cafile=None, certfile=None, keyfile=None):
+                 cafile=None, certfile=None, keyfile=None, ws_patch=None, workers=1,
+                 executors=None, offload=False, metrics_patch=None, compression=None, validate=False,
+                 admission=None, coalesce_methods=None, unix_paths=None, profiler=None, admin_patch=None):
         self.ip_addrs = get_lst(ip_addrs)
         self.port = port
 
-        cls = type(obj)
-        self.methods = {info[0]: info[1] for info in inspect.getmembers(cls, inspect.isfunction) if not info[0].startswith('_')}
+        # Unix sockets are served without TLS and by the main process only
+        self.unix_paths = get_lst(unix_paths) or list()
+
+        self.obj = obj
+        self.storage = storage
+        self.admission = admission
+
+        # Plain functions block the loop, so they can be run in executors:
+        # all of them when offload is set, or those marked by run_in_executor.
+        self.executors = executors or dict()
+
+        def wrap(name, func):
+            pool, limit = getattr(func, 'rpc_executor', (None, None))
+            # Generators would only be created in the executor, not iterated
+            if not hasattr(func, 'rpc_executor') and (
+                    not offload or get_kind(func) != SYNC or inspect.isgeneratorfunction(func)):
+                return None
+            if pool is not None and pool not in self.executors:
+                raise ValueError('Executor {} of method {} is not configured'.format(pool, name))
+            return offload_method(func, self.executors.get(pool), limit)
+
+        # Methods are resolved, bound and classified once, not per request.
+        # coalesce_methods maps names of methods whose concurrent calls with
+        # equal params share one execution to the TTL of their results.
+        self.methods = MethodTable(obj, validate=validate, wrap=wrap, coalesce=coalesce_methods)
 
         self.loop = asyncio.get_event_loop() if loop is None else loop
 
+        self.metrics = Metrics(storage)
+
+        # A Profiler logs slow calls and monitors loop lag; admin_patch
+        # reports them and turns profiling of methods on (POST) and off (DELETE).
+        self.profiler = profiler
+        if profiler is not None:
+            self.metrics.loop_lag = profiler.lag.histogram
+
         self.app = web.Application()
         self.app.router.add_route(
-            'POST', patch, partial(call_method, obj, storage, self.methods)
+            'POST', patch, partial(
+                call_method, obj, storage, self.methods,
+                metrics=self.metrics, compression=compression, admission=admission, profiler=profiler
+            )
         )
+        if ws_patch is not None:
+            self.app.router.add_route(
+                'GET', ws_patch, partial(
+                    call_ws, obj, storage, self.methods, metrics=self.metrics, admission=admission
+                )
+            )
+        if metrics_patch is not None:
+            self.app.router.add_route('GET', metrics_patch, partial(get_metrics, self.metrics))
+        if admin_patch is not None and profiler is not None:
+            self.app.router.add_route('GET', admin_patch, partial(get_report, profiler))
+            self.app.router.add_route('POST', admin_patch, partial(start_profile, profiler))
+            self.app.router.add_route('DELETE', admin_patch, partial(stop_profile, profiler))
 
         self.servers = dict()
 
+        # With several workers every process binds the same addresses with
+        # SO_REUSEPORT and the kernel spreads connections between them.
+        # Deduplication by request id is done per process, so copies of one
+        # request sent to several interfaces may be executed by different
+        # workers: workers mode does not guarantee at-most-once execution.
+        self.workers = workers
+        self.processes = list()
+        self.flag_worker = False
+
         self.delay = 5
+        # Seconds a worker is given to stop after SIGTERM before it is killed
+        self.shutdown_timeout = 5
         self.flag_continue = True
         self.update_task = None
 
@@ -41,8 +147,43 @@ class UniCastServer:
 
     @asyncio.coroutine
     def start(self):
+        if not self.flag_worker:
+            context = multiprocessing.get_context('fork')
+            # SIGTERM is blocked until a worker installs its handler, so an
+            # early stop() still shuts the worker down gracefully
+            mask = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+            try:
+                for _ in range(self.workers - 1):
+                    process = context.Process(target=self._run_worker, daemon=True)
+                    process.start()
+                    self.processes.append(process)
+            finally:
+                signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+            for path in self.unix_paths:
+                yield from self.create_unix_server(path)
+        if self.profiler is not None:
+            self.profiler.lag.start(self.loop)
         self.update_task = self.loop.create_task(self.update())
 
+    def _run_worker(self):
+        self.flag_worker = True
+        self.processes = list()
+        self.servers = dict()
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # A future rather than loop.stop, which is lost if SIGTERM comes
+        # while start() runs
+        stopping = asyncio.Future(loop=self.loop)
+        self.loop.add_signal_handler(signal.SIGTERM, lambda: stopping.done() or stopping.set_result(None))
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+        try:
+            self.loop.run_until_complete(self.start())
+            self.loop.run_until_complete(stopping)
+            self.loop.run_until_complete(self.stop())
+        finally:
+            self.loop.close()
+
     @asyncio.coroutine
     def update(self):
         ip_addrs = list()
@@ -59,13 +200,18 @@ class UniCastServer:
         try:
             srv = yield from self.loop.create_server(
                 self.app.make_handler(), ip_addr, port,
-                ssl=self.ssl_context
+                ssl=self.ssl_context, reuse_port=self.workers > 1
             )
             self.servers[self._get_id(ip_addr, srv.sockets[0].getsockname()[1])] = srv
         except OSError:
             yield from asyncio.sleep(self.delay)
             self.loop.create_task(self.create_server(ip_addr, port))
 
+    @asyncio.coroutine
+    def create_unix_server(self, path):
+        # A socket file left by a previous run is replaced
+        self.servers[path] = yield from self.loop.create_unix_server(self.app.make_handler(), path)
+
     @asyncio.coroutine
     def stop(self):
         self.flag_continue = False
@@ -73,7 +219,26 @@ class UniCastServer:
             srv.close()
         for srv in self.servers.values():
             yield from srv.wait_closed()
-        yield from asyncio.wait([self.update_task], timeout=self.delay)
+        if self.update_task is not None:
+            self.update_task.cancel()
+            yield from asyncio.wait([self.update_task])
+        if self.profiler is not None:
+            self.profiler.lag.stop()
+        if not self.flag_worker:
+            for path in self.unix_paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            yield from self.loop.run_in_executor(None, process.join, self.shutdown_timeout)
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGKILL)
+                yield from self.loop.run_in_executor(None, process.join)
+        self.processes.clear()
 
     def _get_id(self, ip_addr, port):
         return '{}:{}'.format(ip_addr, port)
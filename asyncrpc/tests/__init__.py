@@ -1,11 +1,15 @@
 import json
 import uuid
 import asyncio
+import threading
+
+from asyncrpc.server import run_in_executor, returns_iterator
 
 
 class Test:
 
     count = 0
+    cancelled = 0
 
     @asyncio.coroutine
     def echo(self, msg):
@@ -23,22 +27,67 @@ class Test:
     def get_count(self):
         return self.count
 
+    @asyncio.coroutine
+    def sleep(self, delay):
+        try:
+            yield from asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
     def func(self, msg):
         return msg
 
+    def legacy(self, msg):
+        return (yield from self.echo(msg))
+
+    async def native(self, msg):
+        await asyncio.sleep(0)
+        return msg
+
+    def numbers(self, stop):
+        return (i for i in range(stop))
+
+    def letters(self, text):
+        return iter(text)
+
+    def blobs(self, count, size):
+        return ('x' * size for _ in range(count))
+
+    @returns_iterator
+    def squares(self, stop):
+        for i in range(stop):
+            yield i * i
+
+    @run_in_executor(limit=2)
+    def thread_id(self):
+        return threading.get_ident()
+
+
+def _create_request(method, *args, **kwargs):
+    return dict(
+        jsonrpc='2.0',
+        method=method,
+        params=args or kwargs,
+        id=str(uuid.uuid1())
+    )
+
+
+class Request:
+    content_type = 'application/json'
+
+    def __init__(self, body, headers=None):
+        self.body = body
+        self.headers = headers or dict()
+
+    @asyncio.coroutine
+    def read(self):
+        return json.dumps(self.body).encode()
+
 
 def create_request(method, *args, **kwargs):
-    class Request:
-
-        @asyncio.coroutine
-        def read(self):
-            return json.dumps(
-                dict(
-                    jsonrpc='2.0',
-                    method=method,
-                    params=args or kwargs,
-                    id=str(uuid.uuid1())
-                )
-            ).encode()
-
-    return Request()
+    return Request(_create_request(method, *args, **kwargs))
+
+
+def create_batch_request(*requests):
+    return Request([_create_request(method, *args) for method, args in requests])
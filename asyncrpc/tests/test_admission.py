@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+
+from asyncrpc.admission import Admission, Limiter, Overloaded, get_deadline, TIMEOUT_HEADER
+
+
+class TestAdmission(unittest.TestCase):
+    loop = asyncio.get_event_loop()
+
+    def test_limiter(self):
+        limiter = Limiter(1, queue_size=1)
+        self.loop.run_until_complete(limiter.acquire())
+        self.assertFalse(limiter.full())
+
+        waiter = self.loop.create_task(limiter.acquire())
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(limiter.full())
+        with self.assertRaises(Overloaded):
+            self.loop.run_until_complete(limiter.acquire())
+
+        # The slot is handed to the waiting call
+        limiter.release()
+        self.loop.run_until_complete(waiter)
+        self.assertEqual(limiter.active, 1)
+        limiter.release()
+        self.assertEqual(limiter.active, 0)
+
+    def test_limiter_timeout(self):
+        limiter = Limiter(1, queue_size=1)
+        self.loop.run_until_complete(limiter.acquire())
+        with self.assertRaises(Overloaded):
+            self.loop.run_until_complete(limiter.acquire(timeout=0.01))
+        with self.assertRaises(Overloaded):
+            self.loop.run_until_complete(limiter.acquire(timeout=0))
+        self.assertFalse(limiter.waiters)
+
+    def test_method_limits(self):
+        admission = Admission(limit=2, method_limits=dict(slow=1))
+        held = self.loop.run_until_complete(admission.acquire('slow'))
+        with self.assertRaises(Overloaded):
+            self.loop.run_until_complete(admission.acquire('slow'))
+        self.assertFalse(admission.shedding())
+
+        other = self.loop.run_until_complete(admission.acquire('fast'))
+        self.assertTrue(admission.shedding())
+        admission.release(held)
+        admission.release(other)
+        self.assertEqual(admission.limiter.active, 0)
+        self.assertEqual(admission.method_limiters['slow'].active, 0)
+
+    def test_deadline(self):
+        self.assertIsNone(get_deadline(dict()))
+        self.assertIsNone(get_deadline({TIMEOUT_HEADER: 'soon'}))
+        self.assertGreater(get_deadline({TIMEOUT_HEADER: '10'}), self.loop.time())
@@ -0,0 +1,83 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from asyncrpc.cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    loop = asyncio.get_event_loop()
+
+    def setUp(self):
+        self.calls = 0
+
+    @asyncio.coroutine
+    def get(self, result='result', delay=0):
+        self.calls += 1
+        yield from asyncio.sleep(delay)
+        return result
+
+    @asyncio.coroutine
+    def error(self):
+        self.calls += 1
+        raise Exception('Internal Error')
+
+    def call(self, cache, method, params, call, timeout=None):
+        return self.loop.run_until_complete(cache.call(method, params, call, timeout))
+
+    def test_cache(self):
+        cache = ResponseCache(ttls=dict(get=60))
+        self.assertEqual(self.call(cache, 'get', dict(a=1, b=2), self.get), 'result')
+        self.assertEqual(self.call(cache, 'get', dict(b=2, a=1), self.get), 'result')
+        self.call(cache, 'get', [1], self.get)
+        self.call(cache, 'other', [1], self.get)
+        self.call(cache, 'other', [1], self.get)
+        self.assertEqual(self.calls, 4)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_ttl(self):
+        cache = ResponseCache(ttl=60)
+        self.call(cache, 'get', [], self.get)
+        with patch('time.monotonic', return_value=float('inf')):
+            self.call(cache, 'get', [], self.get)
+        self.assertEqual(self.calls, 2)
+
+    def test_lru(self):
+        cache = ResponseCache(ttl=60, max_size=2)
+        for params in ([1], [2], [1], [3], [1], [2]):
+            self.call(cache, 'get', params, self.get)
+        # [2] was the least recently used when [3] was added
+        self.assertEqual(self.calls, 4)
+        self.assertEqual(len(cache.data), 2)
+
+    def test_single_flight(self):
+        cache = ResponseCache(ttl=60)
+        results = self.loop.run_until_complete(asyncio.gather(
+            *[cache.call('get', [], lambda: self.get(delay=0.01)) for _ in range(5)]
+        ))
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(self.calls, 1)
+
+        # A caller which times out does not cancel the shared call
+        cache.clear()
+        with self.assertRaises(asyncio.TimeoutError):
+            self.call(cache, 'get', [], lambda: self.get(delay=0.05), timeout=0.01)
+        self.assertEqual(self.call(cache, 'get', [], self.get), 'result')
+        self.assertEqual(self.calls, 2)
+
+    def test_single_flight_only(self):
+        cache = ResponseCache(ttls=dict(get=0))
+        self.loop.run_until_complete(asyncio.gather(
+            *[cache.call('get', [], lambda: self.get(delay=0.01)) for _ in range(5)]
+        ))
+        self.call(cache, 'get', [], self.get)
+        self.assertEqual(self.calls, 2)
+        self.assertFalse(cache.data)
+
+    def test_error_not_cached(self):
+        cache = ResponseCache(ttl=60)
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                self.call(cache, 'error', [], self.error)
+        self.assertEqual(self.calls, 2)
+        self.assertFalse(cache.in_flight)
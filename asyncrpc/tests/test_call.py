@@ -3,14 +3,68 @@ import asyncio
 import unittest
 from unittest.mock import patch
 
-from asyncrpc.tests import Test, create_request
-from asyncrpc.call import call_method, RequestsStorage, deserialize
+from asyncrpc.tests import Test, Request, create_request, create_batch_request
+from asyncrpc.call import (
+    call_method, RequestsStorage, deserialize, IdGenerator, RequestEncoder, isinteger, deduplicated, _call_ws_message
+)
+from asyncrpc.codecs import MSGPACK, msgpack, get_codec
+from asyncrpc.metrics import Metrics
+from asyncrpc.methods import MethodTable
+from asyncrpc.admission import Admission, TIMEOUT_HEADER
+from asyncrpc.profiling import Profiler
+
+
+def methods(**functions):
+    return MethodTable(Test(), functions)
 
 
 class Response:
 
-    def __init__(self, body, *args, **kwargs):
-        self.body = deserialize(body)
+    def __init__(self, body, *args, status=200, content_type=None, **kwargs):
+        self.body = deserialize(body, content_type)
+        self.status = status
+        self.content_type = content_type
+
+
+class TestRequest(unittest.TestCase):
+
+    def test_id_generator(self):
+        generate_id = IdGenerator()
+        ids = [generate_id() for _ in range(100)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertTrue(all(deduplicated(request_id) for request_id in ids))
+        self.assertNotEqual(IdGenerator()(), ids[0])
+
+    def test_isinteger(self):
+        self.assertTrue(isinteger(1))
+        self.assertTrue(isinteger('-12'))
+        self.assertFalse(isinteger('1a'))
+
+    def test_deduplicated(self):
+        self.assertTrue(deduplicated('1a'))
+        self.assertFalse(deduplicated(1))
+        self.assertFalse(deduplicated('-12'))
+        self.assertFalse(deduplicated(None))
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_null_id(self, _):
+        storage = RequestsStorage()
+        for msg in ('x', 'y'):
+            request = create_request('echo', msg)
+            request.body['id'] = None
+            respond = asyncio.get_event_loop().run_until_complete(
+                call_method(Test(), storage, methods(echo=Test.echo), request)
+            )
+            self.assertEqual(respond.body['result'], msg)
+
+    def test_encoder(self):
+        for codec in (get_codec(), get_codec(MSGPACK)):
+            encoder = RequestEncoder(codec)
+            for params in ([1, 'a'], dict(msg='"quoted"')):
+                self.assertEqual(
+                    codec.loads(encoder.encode('echo', params, 'id-1')),
+                    dict(jsonrpc='2.0', method='echo', params=params, id='id-1')
+                )
 
 
 class TestJSONRPCCallMethod(unittest.TestCase):
@@ -22,7 +76,7 @@ class TestJSONRPCCallMethod(unittest.TestCase):
         request = create_request('echo', msg=msg)
 
         respond = self.loop.run_until_complete(
-            call_method(Test(), RequestsStorage(), dict(echo=Test.echo), request)
+            call_method(Test(), RequestsStorage(), methods(echo=Test.echo), request)
         )
 
         self.assertIn('jsonrpc', respond.body)
@@ -36,7 +90,7 @@ class TestJSONRPCCallMethod(unittest.TestCase):
         request = create_request('error')
 
         respond = self.loop.run_until_complete(
-            call_method(Test(), RequestsStorage(), dict(error=Test.error), request)
+            call_method(Test(), RequestsStorage(), methods(error=Test.error), request)
         )
 
         self.assertIn('jsonrpc', respond.body)
@@ -49,10 +103,277 @@ class TestJSONRPCCallMethod(unittest.TestCase):
         request = create_request('not_exist')
 
         respond = self.loop.run_until_complete(
-            call_method(Test(), RequestsStorage(), dict(), request)
+            call_method(Test(), RequestsStorage(), methods(), request)
         )
 
         self.assertIn('jsonrpc', respond.body)
         self.assertNotIn('result', respond.body)
         self.assertIn('error', respond.body)
         self.assertIn('id', respond.body)
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_native_coroutine(self, _):
+        request = create_request('native', 'msg')
+
+        respond = self.loop.run_until_complete(
+            call_method(Test(), RequestsStorage(), methods(native=Test.native), request)
+        )
+
+        self.assertEqual(respond.body['result'], 'msg')
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_invalid_params(self, _):
+        obj = Test()
+        request = create_request('echo', 'msg', 'extra')
+
+        respond = self.loop.run_until_complete(
+            call_method(obj, RequestsStorage(), MethodTable(obj, dict(echo=Test.echo), validate=True), request)
+        )
+
+        self.assertIn('Expected at most 1 params, got 2', respond.body['error'])
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_missing_method(self, _):
+        request = create_request('echo', 'msg')
+        del request.body['method']
+
+        respond = self.loop.run_until_complete(call_method(
+            Test(), RequestsStorage(), methods(echo=Test.echo), request,
+            admission=Admission(limit=1), profiler=Profiler()
+        ))
+
+        self.assertEqual(respond.status, 400)
+        self.assertEqual(respond.body['error'], 'Invalid Request')
+        self.assertEqual(respond.body['id'], request.body['id'])
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_missing_params(self, _):
+        request = create_request('get_count')
+        del request.body['params']
+
+        respond = self.loop.run_until_complete(
+            call_method(Test(), RequestsStorage(), methods(get_count=Test.get_count), request)
+        )
+
+        self.assertEqual(respond.status, 200)
+        self.assertEqual(respond.body['result'], 0)
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_batch_call_method(self, _):
+        request = create_batch_request(('echo', ('a',)), ('not_exist', ()), ('echo', ('b',)))
+
+        respond = self.loop.run_until_complete(
+            call_method(Test(), RequestsStorage(), methods(echo=Test.echo), request)
+        )
+
+        self.assertEqual(len(respond.body), 3)
+        self.assertEqual(respond.body[0]['result'], 'a')
+        self.assertIn('error', respond.body[1])
+        self.assertEqual(respond.body[2]['result'], 'b')
+        self.assertEqual([r['id'] for r in respond.body], [r['id'] for r in request.body])
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_batch_dedup(self, _):
+        obj, storage = Test(), RequestsStorage()
+        table = MethodTable(obj, dict(echo=Test.echo, add=Test.add))
+
+        # Numeric ids are not deduplicated in a batch either
+        for param in ('a', 'b'):
+            request = Request([dict(jsonrpc='2.0', method='echo', params=[param], id=1)])
+            respond = self.loop.run_until_complete(call_method(obj, storage, table, request))
+            self.assertEqual(respond.body[0]['result'], param)
+
+        # Batches of notifications are all executed
+        for _ in range(2):
+            request = Request([dict(jsonrpc='2.0', method='add', params=[])])
+            self.loop.run_until_complete(call_method(obj, storage, table, request))
+        self.assertEqual(obj.count, 2)
+
+        # Copies of a batch execute its requests once
+        request = create_batch_request(('add', ()), ('echo', ('c',)))
+        responds = [self.loop.run_until_complete(call_method(obj, storage, table, request)) for _ in range(2)]
+        self.assertEqual(responds[0].body, responds[1].body)
+        self.assertEqual(obj.count, 3)
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_invalid_batch_element(self, _):
+        request = create_batch_request(('echo', ('a',)))
+        request.body[1:] = [1, 'x']
+
+        respond = self.loop.run_until_complete(
+            call_method(Test(), RequestsStorage(), methods(echo=Test.echo), request)
+        )
+
+        self.assertEqual(respond.body[0]['result'], 'a')
+        self.assertEqual(respond.body[1:], [dict(jsonrpc='2.0', error='Invalid Request', id=None)] * 2)
+
+        respond = self.loop.run_until_complete(
+            call_method(Test(), RequestsStorage(), methods(echo=Test.echo), Request(1))
+        )
+        self.assertEqual(respond.body['error'], 'Invalid Request')
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_accept_msgpack(self, _):
+        request = create_request('echo', 'msg')
+        request.headers['Accept'] = MSGPACK
+
+        respond = self.loop.run_until_complete(
+            call_method(Test(), RequestsStorage(), methods(echo=Test.echo), request)
+        )
+
+        self.assertEqual(respond.content_type, MSGPACK)
+        self.assertEqual(respond.body['result'], 'msg')
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_cached_response(self, _):
+        obj, storage = Test(), RequestsStorage()
+        request = create_request('add')
+
+        responds = self.loop.run_until_complete(
+            asyncio.gather(*[
+                call_method(obj, storage, MethodTable(obj, dict(add=Test.add)), Request(request.body))
+                for _ in range(3)
+            ])
+        )
+
+        self.assertEqual(obj.count, 1)
+        self.assertEqual([respond.body for respond in responds], [responds[0].body] * 3)
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_admission(self, _):
+        admission = Admission(limit=1)
+        request = create_request('echo', 'msg')
+        request.headers[TIMEOUT_HEADER] = '0'
+        held = self.loop.run_until_complete(admission.acquire('echo'))
+
+        # The deadline passes before a slot is free
+        respond = self.loop.run_until_complete(
+            call_method(Test(), RequestsStorage(), methods(echo=Test.echo), request, admission=admission)
+        )
+        self.assertEqual(respond.body['error'], 'Server is overloaded')
+
+        # A full server rejects requests without reading them
+        request = create_request('echo', 'msg')
+        with patch.object(request, 'read') as read:
+            respond = self.loop.run_until_complete(
+                call_method(Test(), RequestsStorage(), methods(echo=Test.echo), request, admission=admission)
+            )
+        self.assertFalse(read.called)
+        self.assertEqual(respond.body['error'], 'Server is overloaded')
+
+        admission.release(held)
+        respond = self.loop.run_until_complete(
+            call_method(Test(), RequestsStorage(), methods(echo=Test.echo), request, admission=admission)
+        )
+        self.assertEqual(respond.body['result'], 'msg')
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_deadline(self, _):
+        obj = Test()
+        request = create_request('sleep', 5)
+        request.headers[TIMEOUT_HEADER] = '0.05'
+
+        respond = self.loop.run_until_complete(
+            call_method(obj, RequestsStorage(), MethodTable(obj, dict(sleep=Test.sleep)), request)
+        )
+
+        self.assertEqual(respond.body['error'], 'Deadline exceeded')
+        self.assertEqual(obj.cancelled, 1)
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_coalesce(self, _):
+        obj, storage = Test(), RequestsStorage()
+        methods = MethodTable(obj, dict(add=Test.add, sleep=Test.sleep), coalesce=dict(sleep=0))
+
+        # Requests with different ids and equal params are executed once
+        self.loop.run_until_complete(
+            asyncio.gather(*[call_method(obj, storage, methods, create_request('sleep', 0.01)) for _ in range(3)])
+        )
+        self.loop.run_until_complete(
+            asyncio.gather(*[call_method(obj, storage, methods, create_request('add')) for _ in range(3)])
+        )
+
+        self.assertEqual(methods['sleep'].cache.misses, 1)
+        self.assertIsNone(methods['add'].cache)
+        self.assertEqual(obj.count, 3)
+
+    def test_ws_duplicate(self):
+        obj, storage = Test(), RequestsStorage()
+        methods = MethodTable(obj, dict(sleep=Test.sleep))
+        codec = get_codec()
+        sent = list()
+
+        class WebSocket:
+            @asyncio.coroutine
+            def send_bytes(self, data):
+                sent.append(codec.loads(data))
+
+        request = create_request('sleep', 0.01).body
+        notification = {k: v for k, v in request.items() if k != 'id'}
+        self.loop.run_until_complete(asyncio.gather(*[
+            _call_ws_message(obj, storage, methods, WebSocket(), codec, codec.dumps(body))
+            for body in (request, request, notification)
+        ]))
+
+        # Both copies answer with the response of the one which executed
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(sent[0], sent[1])
+        self.assertEqual(sent[0]['id'], request['id'])
+
+    def test_ws_cancelled(self):
+        obj, storage = Test(), RequestsStorage()
+        methods = MethodTable(obj, dict(sleep=Test.sleep))
+        codec = get_codec()
+        sent = list()
+
+        class WebSocket:
+            @asyncio.coroutine
+            def send_bytes(self, data):
+                sent.append(codec.loads(data))
+
+        data = codec.dumps(create_request('sleep', 0.02).body)
+        first, second = [
+            asyncio.ensure_future(_call_ws_message(obj, storage, methods, WebSocket(), codec, data))
+            for _ in range(2)
+        ]
+        self.loop.run_until_complete(asyncio.sleep(0.005))
+        # The connection of the copy which executes the request is closed
+        first.cancel()
+        self.loop.run_until_complete(second)
+
+        self.assertEqual(obj.cancelled, 1)
+        self.assertEqual(len(sent), 1)
+        self.assertIn('result', sent[0])
+
+    def test_notification(self):
+        obj, storage = Test(), RequestsStorage()
+        request = create_request('add')
+        del request.body['id']
+
+        respond = self.loop.run_until_complete(
+            call_method(obj, storage, MethodTable(obj, dict(add=Test.add)), request)
+        )
+        self.assertEqual(respond.status, 204)
+
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(obj.count, 1)
+        self.assertEqual(len(storage), 0)
+
+    @patch('aiohttp.web.Response', side_effect=Response)
+    def test_metrics(self, _):
+        storage = RequestsStorage()
+        metrics = Metrics(storage)
+        for request in (create_request('echo', 'msg'), create_request('error'), create_request('not_exist')):
+            self.loop.run_until_complete(
+                call_method(Test(), storage, methods(echo=Test.echo, error=Test.error), request, metrics)
+            )
+
+        self.assertEqual(metrics.methods['echo'].statuses, {200: 1})
+        self.assertEqual(metrics.methods['error'].statuses, {500: 1})
+        self.assertEqual(metrics.methods['<unknown>'].statuses, {405: 1})
+        self.assertEqual(metrics.methods['echo'].in_flight, 0)
+        text = metrics.render()
+        self.assertIn('asyncrpc_calls_total{method="echo"} 1', text)
+        self.assertIn('asyncrpc_latency_seconds_count{method="echo"} 1', text)
+        self.assertIn('asyncrpc_storage_size 3', text)
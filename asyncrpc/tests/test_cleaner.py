@@ -7,12 +7,47 @@ class TestMultiCast(unittest.TestCase):
 
     def test_cleaner(self):
         a = Cleaner(clear_timeout=0)
-        a.data['a'] = dict()
+        a.add('a', dict())
+        self.assertEqual(len(a.data), 1)
         a.try_clear()
-        self.assertEquals(len(a.data), 1)
+        self.assertEqual(len(a.data), 0)
         a.try_clear()
-        self.assertEquals(len(a.data), 1)
+        self.assertEqual(len(a.data), 0)
+
+    def test_not_expired(self):
+        a = Cleaner(clear_timeout=60)
+        a.add('a', dict())
+        a.try_clear()
+        self.assertIn('a', a)
+
+    def test_clear_batch(self):
+        a = Cleaner(clear_timeout=0, clear_batch=2)
+        for key in range(5):
+            a.add(key, dict())
+        a.try_clear()
+        self.assertEqual(len(a), 3)
         a.try_clear()
-        self.assertEquals(len(a.data), 0)
         a.try_clear()
-        self.assertEquals(len(a.data), 0)
+        self.assertEqual(len(a), 0)
+
+    def test_max_size(self):
+        a = Cleaner(clear_timeout=60, max_size=2)
+        for key in range(3):
+            a.add(key, dict())
+        self.assertEqual(sorted(a.data), [1, 2])
+
+    def test_touch(self):
+        a = Cleaner(clear_timeout=60, max_size=2)
+        a.add('a', dict())
+        a.add('b', dict())
+        a.touch('a')
+        a.add('c', dict())
+        self.assertEqual(sorted(a.data), ['a', 'c'])
+
+    def test_touch_bounded(self):
+        a = Cleaner(clear_timeout=60, max_size=10)
+        a.add('a', dict())
+        for _ in range(1000):
+            a.touch('a')
+        self.assertEqual(sum(len(keys) for _, keys in a.buckets), 1)
+        self.assertFalse(a.touches)
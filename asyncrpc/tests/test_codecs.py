@@ -0,0 +1,91 @@
+import os
+import gzip
+import zlib
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from asyncrpc.codecs import JSON, FRAMES, MSGPACK, msgpack, get_codec, negotiate
+from asyncrpc.compression import (
+    Compression, Compressor, compressors, decompress, register, negotiate as negotiate_encoding
+)
+
+
+class TestCodecs(unittest.TestCase):
+
+    def test_get_codec(self):
+        self.assertEqual(get_codec('application/json; charset=utf-8').content_type, JSON)
+        self.assertEqual(get_codec('text/plain').content_type, JSON)
+        self.assertEqual(get_codec(None).content_type, JSON)
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate('text/html, {}'.format(FRAMES)).content_type, FRAMES)
+        self.assertIs(negotiate(None, get_codec(FRAMES)), get_codec(FRAMES))
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        codec = get_codec(MSGPACK)
+        self.assertEqual(codec.loads(codec.dumps(dict(a=[1, 2.5, 'b']))), dict(a=[1, 2.5, 'b']))
+
+    def test_frames(self):
+        codec = get_codec(FRAMES)
+        value = dict(id='1', params=[b'abc', dict(data=bytearray(b'\x00\x01')), 'text', 1])
+        data = codec.dumps(value)
+
+        result = codec.loads(data)
+        self.assertIsInstance(result['params'][0], memoryview)
+        self.assertEqual(result['params'][0].obj, data)
+        self.assertEqual(bytes(result['params'][0]), b'abc')
+        self.assertEqual(bytes(result['params'][1]['data']), b'\x00\x01')
+        self.assertEqual(result['params'][2:], ['text', 1])
+
+    def test_frames_reserved_key(self):
+        codec = get_codec(FRAMES)
+        value = [{'$attachment': 0}, {'$$attachment': 'a', 'b': b'c'}, {'attachment': 1}]
+        result = codec.loads(codec.dumps(value))
+
+        self.assertEqual(result[0], {'$attachment': 0})
+        self.assertEqual(result[1]['$$attachment'], 'a')
+        self.assertEqual(bytes(result[1]['b']), b'c')
+        self.assertEqual(result[2], {'attachment': 1})
+
+
+class TestCompression(unittest.TestCase):
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate_encoding('br, gzip;q=0.5, deflate').name, 'gzip')
+        self.assertEqual(negotiate_encoding('gzip;q=0, deflate').name, 'deflate')
+        self.assertIsNone(negotiate_encoding('br'))
+        self.assertIsNone(negotiate_encoding(None))
+
+    def test_threshold(self):
+        loop = asyncio.get_event_loop()
+        compression = Compression(threshold=10)
+        compressor = compressors['deflate']
+        self.assertEqual(loop.run_until_complete(compression.compress(compressor, b'short')), (b'short', None))
+        data, encoding = loop.run_until_complete(compression.compress(compressor, b'x' * 100))
+        self.assertEqual(encoding, 'deflate')
+        self.assertEqual(compressor.decompress(data), b'x' * 100)
+
+    def test_decompress(self):
+        self.assertEqual(decompress(b'data', None), b'data')
+        self.assertEqual(decompress(gzip.compress(b'data'), 'gzip'), b'data')
+        # Deflate is decoded with or without the zlib header
+        self.assertEqual(decompress(zlib.compress(b'data'), 'deflate'), b'data')
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        self.assertEqual(decompress(raw.compress(b'data') + raw.flush(), 'deflate'), b'data')
+        with self.assertRaises(ValueError):
+            decompress(b'data', 'unknown')
+
+    def test_decompress_offload(self):
+        loop = asyncio.get_event_loop()
+        compression = Compression(offload_threshold=100)
+        register(Compressor('test', zlib.compress, zlib.decompress))
+        self.addCleanup(compressors.pop, 'test')
+        small, large = b'x' * 10, os.urandom(200)
+
+        with patch.object(loop, 'run_in_executor', wraps=loop.run_in_executor) as run_in_executor:
+            self.assertEqual(loop.run_until_complete(compression.decompress(zlib.compress(small), 'test')), small)
+            run_in_executor.assert_not_called()
+            self.assertEqual(loop.run_until_complete(compression.decompress(zlib.compress(large), 'test')), large)
+            run_in_executor.assert_called_once_with(None, decompress, zlib.compress(large), 'test')
@@ -0,0 +1,149 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from aiohttp import ClientOSError
+
+from asyncrpc.client import UniCastClient
+from asyncrpc.endpoints import (
+    LatencyTracker, EndpointHealth, Balancer, RoundRobinBalancer, LeastOutstandingBalancer, PowerOfTwoBalancer,
+    ConsistentHashBalancer
+)
+
+
+class TestLatencyTracker(unittest.TestCase):
+
+    def test_order(self):
+        tracker = LatencyTracker()
+        tracker.observe('slow', 0.5)
+        tracker.observe('fast', 0.1)
+        self.assertEqual(tracker.order(['slow', 'fast', 'new']), ['new', 'fast', 'slow'])
+
+    def test_ewma(self):
+        tracker = LatencyTracker(alpha=0.5)
+        tracker.observe('a', 1)
+        tracker.observe('a', 3)
+        self.assertEqual(tracker.get('a'), 2)
+        self.assertGreater(tracker.threshold('a'), tracker.get('a'))
+
+
+class TestEndpointHealth(unittest.TestCase):
+
+    def test_circuit_breaker(self):
+        health = EndpointHealth(max_failures=2, reprobe_timeout=60)
+        health.failure('a')
+        self.assertTrue(health.available('a'))
+        health.failure('a')
+        self.assertFalse(health.available('a'))
+        self.assertEqual(health.filter(['a', 'b']), ['b'])
+        self.assertEqual(health.filter(['a']), ['a'])
+        health.success('a')
+        self.assertTrue(health.available('a'))
+
+    def test_reprobe(self):
+        health = EndpointHealth(max_failures=1, reprobe_timeout=0)
+        health.failure('a')
+        self.assertTrue(health.available('a'))
+
+    @patch('asyncrpc.endpoints.time.perf_counter')
+    def test_single_probe(self, perf_counter):
+        health = EndpointHealth(max_failures=1, reprobe_timeout=10)
+        perf_counter.return_value = 0
+        health.failure('a')
+
+        # Once the circuit may close, one request probes the endpoint
+        perf_counter.return_value = 10
+        self.assertTrue(health.available('a'))
+        health.attempt('a')
+        self.assertFalse(health.available('a'))
+        health.failure('a')
+        self.assertFalse(health.available('a'))
+
+        # A probe which is not answered is replaced
+        perf_counter.return_value = 20
+        health.attempt('a')
+        perf_counter.return_value = 30
+        self.assertTrue(health.available('a'))
+        health.attempt('a')
+        health.success('a')
+        self.assertTrue(health.available('a'))
+        health.attempt('a')
+        self.assertTrue(health.available('a'))
+
+
+class TestClientHealth(unittest.TestCase):
+
+    loop = asyncio.get_event_loop()
+
+    def setUp(self):
+        self.client = UniCastClient(
+            interfaces_info=[('127.0.0.1', 9000)], health=EndpointHealth(max_failures=1, reprobe_timeout=60)
+        )
+
+    @asyncio.coroutine
+    def _fail(self, error):
+        raise error
+
+    def test_timeout(self):
+        interface = self.client.interfaces_info[0]
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(self.client._tracked(interface, self._fail(asyncio.TimeoutError())))
+        self.assertFalse(self.client.health.available(interface))
+
+    def test_deadline(self):
+        interface = self.client.interfaces_info[0]
+        deadline = self.loop.time() + 0.01
+        tracked = self.client._tracked(interface, asyncio.sleep(1), deadline)
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(asyncio.wait_for(tracked, deadline - self.loop.time()))
+        self.assertFalse(self.client.health.available(interface))
+
+    def test_cancelled(self):
+        interface = self.client.interfaces_info[0]
+        task = asyncio.ensure_future(self.client._tracked(interface, asyncio.sleep(1)))
+        self.loop.call_soon(task.cancel)
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(task)
+        self.assertTrue(self.client.health.available(interface))
+        with self.assertRaises(ClientOSError):
+            self.loop.run_until_complete(self.client._tracked(interface, self._fail(ClientOSError())))
+        self.assertFalse(self.client.health.available(interface))
+
+
+class TestBalancers(unittest.TestCase):
+    endpoints = [('127.0.0.1', 9000), ('127.0.0.2', 9000), ('127.0.0.3', 9000)]
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            Balancer()
+
+    def test_round_robin(self):
+        balancer = RoundRobinBalancer()
+        chosen = [balancer.choose(self.endpoints) for _ in range(6)]
+        self.assertEqual(chosen, self.endpoints * 2)
+
+    def test_least_outstanding(self):
+        balancer = LeastOutstandingBalancer()
+        balancer.acquire(self.endpoints[0])
+        balancer.acquire(self.endpoints[1])
+        self.assertEqual(balancer.choose(self.endpoints), self.endpoints[2])
+        balancer.release(self.endpoints[0])
+        self.assertEqual(balancer.choose(self.endpoints[:2]), self.endpoints[0])
+
+    def test_power_of_two(self):
+        balancer = PowerOfTwoBalancer()
+        balancer.acquire(self.endpoints[0])
+        self.assertEqual(balancer.choose(self.endpoints[:2]), self.endpoints[1])
+
+    def test_consistent_hash(self):
+        balancer = ConsistentHashBalancer()
+        requests = [dict(method='method{}'.format(i)) for i in range(50)]
+        chosen = [balancer.choose(self.endpoints, request) for request in requests]
+        self.assertEqual(chosen, [balancer.choose(self.endpoints, request) for request in requests])
+        self.assertEqual(len(set(chosen)), len(self.endpoints))
+
+        # Keys of the remaining endpoints stay where they were
+        remaining = self.endpoints[:2]
+        for request, endpoint in zip(requests, chosen):
+            if endpoint in remaining:
+                self.assertEqual(balancer.choose(remaining, request), endpoint)
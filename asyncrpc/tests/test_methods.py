@@ -0,0 +1,36 @@
+import unittest
+
+from asyncrpc.tests import Test
+from asyncrpc.methods import MethodTable, compile_validator, SYNC, COROUTINE, NATIVE, EXECUTOR
+
+
+def func(a, b=1, *, c):
+    pass
+
+
+class TestMethods(unittest.TestCase):
+
+    def test_kinds(self):
+        methods = MethodTable(Test(), wrap=lambda name, func: func if name == 'thread_id' else None)
+
+        self.assertNotIn('_create_request', methods)
+        self.assertEqual(methods['func'].kind, SYNC)
+        self.assertEqual(methods['squares'].kind, SYNC)
+        self.assertEqual(methods['echo'].kind, COROUTINE)
+        self.assertEqual(methods['legacy'].kind, COROUTINE)
+        self.assertEqual(methods['native'].kind, NATIVE)
+        self.assertEqual(methods['thread_id'].kind, EXECUTOR)
+        self.assertTrue(methods['native'].awaitable)
+        self.assertFalse(methods['func'].awaitable)
+        self.assertEqual(methods['func'].call('msg'), 'msg')
+
+    def test_validator(self):
+        validate = compile_validator(func)
+
+        self.assertIsNone(validate(dict(a=1, c=2)))
+        self.assertEqual(validate([1, 2]), 'Missing params c')
+        self.assertEqual(validate(dict(a=1, c=2, d=3)), 'Unexpected params d')
+        self.assertEqual(validate(dict(b=1)), 'Missing params a, c')
+        self.assertEqual(validate([1, 2, 3]), 'Expected at most 2 params, got 3')
+        self.assertIsNone(compile_validator(lambda *args: None)([1, 2, 3]))
+        self.assertEqual(validate('a'), 'Params must be an array or an object')
@@ -0,0 +1,113 @@
+import time
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from asyncrpc.tests import Test, create_request
+from asyncrpc.call import call_method, RequestsStorage
+from asyncrpc.methods import MethodTable
+from asyncrpc.server import UniCastServer
+from asyncrpc.client import UniCastClient
+from asyncrpc.profiling import Profiler, LoopLagMonitor, format_profile
+
+
+class TestProfiling(unittest.TestCase):
+    loop = asyncio.get_event_loop()
+
+    def test_loop_lag(self):
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start(self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0.02))
+        self.loop.call_soon(time.sleep, 0.05)
+        self.loop.run_until_complete(asyncio.sleep(0.1))
+        monitor.stop()
+
+        self.assertGreaterEqual(monitor.max, 0.03)
+        self.assertGreater(monitor.histogram.count, 1)
+
+    @patch('aiohttp.web.Response')
+    def test_slow_calls(self, _):
+        obj, profiler = Test(), Profiler(slow_threshold=0)
+        methods = MethodTable(obj)
+        with self.assertLogs('asyncrpc.profiling', 'WARNING'):
+            self.loop.run_until_complete(
+                call_method(obj, RequestsStorage(), methods, create_request('echo', 'msg'), profiler=profiler)
+            )
+
+        (method, _, phases), = profiler.slow_calls
+        self.assertEqual(method, 'echo')
+        for phase in ('sweep', 'read', 'deserialize', 'dedup', 'execute', 'serialize'):
+            self.assertIn(phase + '=', phases)
+
+    @patch('aiohttp.web.Response')
+    def test_profile(self, _):
+        obj, profiler = Test(), Profiler()
+        methods = MethodTable(obj)
+        profiler.start_profile(['func'])
+        for method in ('func', 'echo'):
+            self.loop.run_until_complete(
+                call_method(obj, RequestsStorage(), methods, create_request(method, 'msg'), profiler=profiler)
+            )
+
+        self.assertEqual(profiler.active, 0)
+        stats = format_profile(profiler.stop_profile())
+        self.assertIn('(func)', stats)
+        self.assertNotIn('(echo)', stats)
+        self.assertIsNone(profiler.stop_profile())
+
+    def test_empty_profile(self):
+        profiler = Profiler()
+        profiler.start_profile(['func'])
+        self.assertEqual(format_profile(profiler.stop_profile()), 'No calls were profiled\n')
+
+
+class TestAdminRoute(unittest.TestCase):
+    loop = asyncio.get_event_loop()
+
+    def setUp(self):
+        port = 9000
+        self.url = 'http://127.0.0.1:{}/admin'.format(port)
+        self.srvc = UniCastServer(
+            obj=Test(),
+            ip_addrs='127.0.0.1',
+            port=port,
+            profiler=Profiler(),
+            admin_patch='/admin'
+        )
+        self.srvc.delay = 0.1
+        self.loop.run_until_complete(self.srvc.start())
+        self.client = UniCastClient(interfaces_info=[('127.0.0.1', port)])
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.client.close())
+        self.loop.run_until_complete(self.srvc.stop())
+
+    @asyncio.coroutine
+    def admin(self, method, **kwargs):
+        response = yield from self.client.get_session().request(method, self.url, **kwargs)
+        try:
+            return response.status, (yield from response.text())
+        finally:
+            yield from response.release()
+
+    def test_admin(self):
+        self.loop.run_until_complete(self.client.echo('msg'))
+        status, text = self.loop.run_until_complete(self.admin('POST', params=dict(methods='func')))
+        self.assertEqual(status, 200)
+        self.assertIn('profiled methods: func', text)
+
+        self.loop.run_until_complete(self.client.func('msg'))
+        status, text = self.loop.run_until_complete(self.admin('GET'))
+        self.assertIn('loop lag', text)
+        self.assertIn('asyncrpc_loop_lag_seconds_count', self.srvc.metrics.render())
+        status, text = self.loop.run_until_complete(self.admin('DELETE'))
+        self.assertEqual(status, 200)
+        self.assertIn('(func)', text)
+        status, _ = self.loop.run_until_complete(self.admin('DELETE'))
+        self.assertEqual(status, 404)
+
+    def test_admin_empty_profile(self):
+        self.loop.run_until_complete(self.admin('POST', params=dict(methods='func')))
+        status, text = self.loop.run_until_complete(self.admin('DELETE'))
+        self.assertEqual(status, 200)
+        self.assertEqual(text, 'No calls were profiled\n')
@@ -1,11 +1,19 @@
 import os
 import uuid
+import tempfile
 import asyncio
 import unittest
+import threading
+from unittest.mock import ANY, call, patch
+
+import aiohttp
 
 from asyncrpc.tests import Test
 from asyncrpc.server import UniCastServer
-from asyncrpc.client import UniCastClient, RPCMethodException
+from asyncrpc.client import UniCastClient, LocalClient, WebSocketConnection, RPCMethodException
+from asyncrpc.codecs import MSGPACK, FRAMES, msgpack, get_codec
+from asyncrpc.endpoints import RoundRobinBalancer
+from asyncrpc.compression import Compression, decompress
 
 
 class TestUniCastServer(unittest.TestCase):
@@ -44,11 +52,103 @@ class TestUniCastServer(unittest.TestCase):
         with self.assertRaises(RPCMethodException):
             self.loop.run_until_complete(self.client.error())
 
+    def test_timeout(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(self.client.with_timeout(0.1).sleep(5))
+        result = self.loop.run_until_complete(self.client.with_timeout(5).echo('msg'))
+        self.assertEqual(result, 'msg')
+
+    def test_notify(self):
+        self.loop.run_until_complete(self.client.notify('sleep', 0))
+        result = self.loop.run_until_complete(self.client.echo('msg'))
+        self.assertEqual(result, 'msg')
+
     def test_func(self):
         msg = str(uuid.uuid1())
         result = self.loop.run_until_complete(self.client.func(msg))
         self.assertEquals(result, msg)
 
+    def test_run_in_executor(self):
+        result = self.loop.run_until_complete(self.client.thread_id())
+        self.assertNotEqual(result, threading.get_ident())
+
+    def test_stream(self):
+        async def collect():
+            items = list()
+            async for item in self.client.stream('numbers', 5):
+                items.append(item)
+            return items
+
+        self.assertEqual(self.loop.run_until_complete(collect()), list(range(5)))
+        self.assertEqual(self.loop.run_until_complete(self.client.numbers(3)), list(range(3)))
+
+    def test_generator_function(self):
+        async def collect():
+            return [item async for item in self.client.stream('squares', 4)]
+
+        self.assertEqual(self.loop.run_until_complete(collect()), [0, 1, 4, 9])
+        self.assertEqual(self.loop.run_until_complete(self.client.squares(3)), [0, 1, 4])
+        # Undecorated generator functions are coroutines
+        self.assertEqual(self.loop.run_until_complete(self.client.legacy('msg')), 'msg')
+        self.assertEqual(self.loop.run_until_complete(self.client.letters('ab')), ['a', 'b'])
+
+    def test_stream_large_items(self):
+        async def collect():
+            return [item async for item in self.client.stream('blobs', 3, 200000)]
+
+        self.assertEqual(self.loop.run_until_complete(collect()), ['x' * 200000] * 3)
+
+    def test_stream_error(self):
+        async def collect():
+            async for _ in self.client.stream('not_exist'):
+                pass
+
+        with self.assertRaises(RPCMethodException):
+            self.loop.run_until_complete(collect())
+
+    def test_session_reused(self):
+        self.loop.run_until_complete(self.client.func('msg'))
+        session = self.client.session
+        with self.assertRaises(RPCMethodException):
+            self.loop.run_until_complete(self.client.error())
+        self.loop.run_until_complete(self.client.func('msg'))
+        self.assertIs(self.client.session, session)
+
+    def test_connections_reused(self):
+        for _ in range(3):
+            self.loop.run_until_complete(self.client.func('msg'))
+            self.loop.run_until_complete(asyncio.sleep(0.01))
+
+        # Every interface keeps its one idle connection
+        sessions = [self.client.session] + list(self.client.unix_sessions.values())
+        idle = [len(conns) for session in sessions if session for conns in session.connector._conns.values()]
+        self.assertEqual(idle, [1] * len(self.interfaces_info))
+
+    def test_metrics(self):
+        self.loop.run_until_complete(self.client.func('msg'))
+        with self.assertRaises(RPCMethodException):
+            self.loop.run_until_complete(self.client.error())
+
+        self.assertEqual(self.client.stats.methods['func'].statuses[200], 1)
+        self.assertEqual(self.client.stats.methods['error'].statuses[500], 1)
+
+    def test_batch(self):
+        batch = self.client.batch()
+        first, second = batch.echo('first'), batch.func('second')
+        error = batch.error()
+        self.loop.run_until_complete(batch.close())
+        self.assertEqual(first.result(), 'first')
+        self.assertEqual(second.result(), 'second')
+        self.assertIsInstance(error.exception(), RPCMethodException)
+
+    def test_coalesce(self):
+        self.client.coalesce = True
+        msgs = [str(uuid.uuid1()) for _ in range(10)]
+        result = self.loop.run_until_complete(
+            asyncio.gather(*[self.client.echo(msg) for msg in msgs])
+        )
+        self.assertEqual(result, msgs)
+
 
 class TestUniCastServerWithSSLAuth(TestUniCastServer):
 
@@ -73,3 +173,233 @@ class TestUniCastServerWithSSLAuth(TestUniCastServer):
             certfile=os.path.join(ssl_path, 'crt', 'client01.crt'),
             keyfile=os.path.join(ssl_path, 'key', 'client01.key')
         )
+
+
+class TestUniCastServerWebSocket(TestUniCastServer):
+
+    def setUp(self):
+        port = 9000
+        self.interfaces_info = [('127.0.0.1', port), ('127.0.0.2', port)]
+        ip_addrs = [ip_addr for ip_addr, _ in self.interfaces_info]
+        self.srvc = UniCastServer(
+            obj=Test(),
+            ip_addrs=ip_addrs,
+            port=port,
+            ws_patch='/ws'
+        )
+        self.srvc.delay = 0.1
+        self.loop.run_until_complete(self.srvc.start())
+
+        self.client = UniCastClient(interfaces_info=self.interfaces_info, ws_patch='ws')
+
+    def test_concurrent_calls(self):
+        msgs = [str(uuid.uuid1()) for _ in range(50)]
+        result = self.loop.run_until_complete(
+            asyncio.gather(*[self.client.echo(msg) for msg in msgs])
+        )
+        self.assertEqual(result, msgs)
+        self.assertEqual(len(self.client.ws_connections), len(self.interfaces_info))
+
+    @unittest.skip('calls go over websockets')
+    def test_connections_reused(self):
+        pass
+
+
+@unittest.skipIf(msgpack is None, 'msgpack is not installed')
+class TestUniCastServerMsgPack(TestUniCastServer):
+
+    def setUp(self):
+        super().setUp()
+        self.client = UniCastClient(interfaces_info=self.interfaces_info, content_type=MSGPACK)
+
+
+class TestUniCastServerFrames(TestUniCastServer):
+
+    def setUp(self):
+        super().setUp()
+        self.client = UniCastClient(interfaces_info=self.interfaces_info, content_type=FRAMES)
+
+    def test_attachment(self):
+        data = os.urandom(1024)
+        result = self.loop.run_until_complete(self.client.echo(data))
+        self.assertIsInstance(result, memoryview)
+        self.assertEqual(bytes(result), data)
+
+
+class TestUniCastServerCompression(TestUniCastServer):
+
+    def setUp(self):
+        port = 9000
+        self.interfaces_info = [('127.0.0.1', port), ('127.0.0.2', port)]
+        ip_addrs = [ip_addr for ip_addr, _ in self.interfaces_info]
+        self.srvc = UniCastServer(
+            obj=Test(),
+            ip_addrs=ip_addrs,
+            port=port,
+            compression=Compression(threshold=0)
+        )
+        self.srvc.delay = 0.1
+        self.loop.run_until_complete(self.srvc.start())
+
+        self.client = UniCastClient(
+            interfaces_info=self.interfaces_info,
+            compression=Compression(threshold=0, offload_threshold=1024)
+        )
+
+    def test_large_payload(self):
+        msg = 'x' * 4096
+        result = self.loop.run_until_complete(self.client.echo(msg))
+        self.assertEqual(result, msg)
+
+    def test_response_decompress_offload(self):
+        msg = os.urandom(4096).hex()
+        self.client.headers['Accept-Encoding'] = 'gzip'
+        with patch.object(self.loop, 'run_in_executor', wraps=self.loop.run_in_executor) as run_in_executor:
+            self.assertEqual(self.loop.run_until_complete(self.client.echo(msg)), msg)
+        # The client decodes gzip responses itself instead of aiohttp
+        self.assertIn(call(None, decompress, ANY, 'gzip'), run_in_executor.call_args_list)
+
+
+class TestUniCastServerUnix(TestUniCastServer):
+
+    def setUp(self):
+        port = 9000
+        self.path = os.path.join(tempfile.mkdtemp(), 'asyncrpc.sock')
+        self.interfaces_info = [(self.path, None), ('127.0.0.1', port)]
+        self.srvc = UniCastServer(
+            obj=Test(),
+            ip_addrs='127.0.0.1',
+            port=port,
+            unix_paths=self.path
+        )
+        self.srvc.delay = 0.1
+        self.loop.run_until_complete(self.srvc.start())
+
+        self.client = UniCastClient(interfaces_info=self.interfaces_info)
+
+    def test_unix_session(self):
+        self.loop.run_until_complete(self.client.func('msg'))
+        self.assertIn(self.path, self.client.unix_sessions)
+
+    def test_socket_removed(self):
+        self.loop.run_until_complete(self.srvc.stop())
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestWebSocketConnection(unittest.TestCase):
+
+    loop = asyncio.get_event_loop()
+
+    def test_batch_response(self):
+        codec = get_codec()
+        messages = asyncio.Queue()
+        response = [dict(jsonrpc='2.0', result='a', id='1'), dict(jsonrpc='2.0', error='Invalid Request', id=None)]
+
+        class WebSocket:
+            closed = False
+
+            @asyncio.coroutine
+            def send_bytes(self, data):
+                messages.put_nowait(aiohttp.WSMessage(aiohttp.WSMsgType.BINARY, codec.dumps(response), None))
+
+            @asyncio.coroutine
+            def receive(self):
+                return (yield from messages.get())
+
+        connection = WebSocketConnection(WebSocket(), self.loop, codec)
+
+        data = self.loop.run_until_complete(connection.send('1', b''))
+        self.assertEqual(codec.loads(data)['result'], 'a')
+        self.assertFalse(connection.closed)
+
+        messages.put_nowait(aiohttp.WSMessage(aiohttp.WSMsgType.CLOSE, None, None))
+        self.loop.run_until_complete(connection.reader)
+
+
+class TestLocalClient(unittest.TestCase):
+
+    loop = asyncio.get_event_loop()
+
+    def setUp(self):
+        self.obj = Test()
+        self.srvc = UniCastServer(obj=self.obj, ip_addrs=[], port=None)
+        self.client = LocalClient(self.srvc)
+
+    def test_rpc(self):
+        msg = dict(key='value')
+        self.assertIs(self.loop.run_until_complete(self.client.echo(msg)), msg)
+        self.assertEqual(self.loop.run_until_complete(self.client.native(msg='msg')), 'msg')
+        self.assertEqual(self.loop.run_until_complete(self.client.numbers(3)), list(range(3)))
+
+    def test_exception(self):
+        with self.assertRaises(RPCMethodException):
+            self.loop.run_until_complete(self.client.error())
+        self.assertEqual(self.srvc.metrics.methods['error'].statuses, {500: 1})
+
+    def test_notify(self):
+        self.loop.run_until_complete(self.client.notify('add'))
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(self.obj.count, 1)
+
+    def test_validate(self):
+        client = LocalClient(UniCastServer(obj=self.obj, ip_addrs=[], port=None, validate=True))
+        self.assertEqual(self.loop.run_until_complete(client.echo('msg')), 'msg')
+        self.assertEqual(self.loop.run_until_complete(client.echo(msg='msg')), 'msg')
+        with self.assertRaises(RPCMethodException):
+            self.loop.run_until_complete(client.echo('msg', 'extra'))
+
+
+class TestUniCastServerWorkers(TestUniCastServer):
+
+    def setUp(self):
+        port = 9000
+        self.interfaces_info = [('127.0.0.1', port)]
+        self.srvc = UniCastServer(
+            obj=Test(),
+            ip_addrs='127.0.0.1',
+            port=port,
+            workers=2
+        )
+        self.srvc.delay = 0.1
+        self.loop.run_until_complete(self.srvc.start())
+
+        self.client = UniCastClient(interfaces_info=self.interfaces_info)
+
+    @unittest.skip('obj state is kept per worker process')
+    def test_only_one_called(self):
+        pass
+
+    def test_stop_workers(self):
+        processes = list(self.srvc.processes)
+        self.assertEqual(len(processes), 1)
+        self.loop.run_until_complete(self.srvc.stop())
+        self.assertFalse(any(process.is_alive() for process in processes))
+        # Workers stop gracefully instead of being killed
+        self.assertEqual([process.exitcode for process in processes], [0])
+
+
+class TestUniCastServerHedged(TestUniCastServer):
+
+    def setUp(self):
+        super().setUp()
+        self.client = UniCastClient(interfaces_info=self.interfaces_info, hedge_delay=1)
+
+    def test_hedge(self):
+        self.loop.run_until_complete(self.client.echo('msg'))
+        self.assertEqual(list(self.client.latency.mean), [self.interfaces_info[0]])
+
+
+class TestUniCastServerBalanced(TestUniCastServer):
+
+    def setUp(self):
+        super().setUp()
+        # Nothing listens on the last interface
+        self.client = UniCastClient(
+            interfaces_info=self.interfaces_info + [('127.0.0.3', 9000)],
+            balancer=RoundRobinBalancer()
+        )
+
+    def test_dead_interface(self):
+        for _ in range(6):
+            self.loop.run_until_complete(self.client.echo('msg'))
+        self.assertIn(('127.0.0.3', 9000), self.client.health.failures)
@@ -0,0 +1,5 @@
+"""Throughput and latency benchmarks of UniCastServer and UniCastClient.
+
+Run ``python -m benchmarks --help`` from the repository root. Every scenario
+is printed as one JSON line.
+"""
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import itertools
+
+import asyncrpc
+from asyncrpc.server import UniCastServer
+from asyncrpc.client import UniCastClient
+
+
+SSL_PATH = os.path.join(os.path.dirname(os.path.abspath(asyncrpc.__file__)), 'tests', 'ssl')
+IP_ADDRS = ['127.0.0.1', '127.0.0.2']
+
+
+class Bench:
+
+    @asyncio.coroutine
+    def echo(self, payload):
+        return payload
+
+    def echo_sync(self, payload):
+        return payload
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def create_server(interfaces, port, tls, loop):
+    kwargs = dict()
+    if tls:
+        kwargs = dict(
+            cafile=os.path.join(SSL_PATH, 'ca.crt'),
+            certfile=os.path.join(SSL_PATH, 'crt', 'server.crt'),
+            keyfile=os.path.join(SSL_PATH, 'key', 'server.key')
+        )
+    server = UniCastServer(obj=Bench(), ip_addrs=IP_ADDRS[:interfaces], port=port, loop=loop, **kwargs)
+    server.delay = 0.1
+    return server
+
+
+def create_client(interfaces, port, tls, loop):
+    kwargs = dict()
+    if tls:
+        kwargs = dict(
+            certfile=os.path.join(SSL_PATH, 'crt', 'client01.crt'),
+            keyfile=os.path.join(SSL_PATH, 'key', 'client01.key')
+        )
+    interfaces_info = [(ip_addr, port) for ip_addr in IP_ADDRS[:interfaces]]
+    return UniCastClient(interfaces_info=interfaces_info, loop=loop, **kwargs)
+
+
+@asyncio.coroutine
+def wait_started(server, interfaces, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while len(server.servers) < interfaces:
+        if time.perf_counter() > deadline:
+            raise RuntimeError('Server did not start')
+        yield from asyncio.sleep(0.05)
+
+
+@asyncio.coroutine
+def drive(client, method, payload, calls, concurrency):
+    latencies = list()
+    errors = 0
+    counter = itertools.count()
+
+    @asyncio.coroutine
+    def worker():
+        nonlocal errors
+        while next(counter) < calls:
+            start_ts = time.perf_counter()
+            try:
+                yield from getattr(client, method)(payload)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start_ts)
+
+    start_ts = time.perf_counter()
+    yield from asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - start_ts, sorted(latencies), errors
+
+
+@asyncio.coroutine
+def run_scenario(scenario, port, calls, warmup, loop):
+    server = create_server(scenario['interfaces'], port, scenario['tls'], loop)
+    yield from server.start()
+    client = create_client(scenario['interfaces'], port, scenario['tls'], loop)
+    try:
+        yield from wait_started(server, scenario['interfaces'])
+        payload = 'x' * scenario['payload']
+        yield from drive(client, scenario['method'], payload, warmup, scenario['concurrency'])
+        elapsed, latencies, errors = yield from drive(
+            client, scenario['method'], payload, calls, scenario['concurrency']
+        )
+    finally:
+        yield from client.close()
+        yield from server.stop()
+
+    result = dict(scenario, calls=calls, errors=errors, elapsed=elapsed)
+    result['calls_per_sec'] = len(latencies) / elapsed if elapsed else None
+    if latencies:
+        result.update(
+            latency_mean=sum(latencies) / len(latencies),
+            latency_p50=percentile(latencies, 0.5),
+            latency_p90=percentile(latencies, 0.9),
+            latency_p99=percentile(latencies, 0.99),
+            latency_max=latencies[-1]
+        )
+    return result
+
+
+def scenarios(args):
+    for payload, concurrency, interfaces, tls, method in itertools.product(
+            args.payload, args.concurrency, args.interfaces, args.tls, args.method):
+        yield dict(
+            payload=payload,
+            concurrency=concurrency,
+            interfaces=interfaces,
+            tls=tls,
+            method=method
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    parser.add_argument('--payload', type=int, nargs='+', default=[64, 4096],
+                        help='payload sizes in bytes')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 32],
+                        help='numbers of concurrent callers')
+    parser.add_argument('--interfaces', type=int, nargs='+', default=[1, 2], choices=[1, 2],
+                        help='numbers of interfaces the client calls')
+    parser.add_argument('--tls', type=lambda value: value == 'on', nargs='+', default=[False],
+                        metavar='{on,off}', help='TLS with the certificates of asyncrpc/tests/ssl')
+    parser.add_argument('--method', nargs='+', default=['echo', 'echo_sync'], choices=['echo', 'echo_sync'],
+                        help='coroutine or plain server method')
+    parser.add_argument('--calls', type=int, default=1000, help='measured calls per scenario')
+    parser.add_argument('--warmup', type=int, default=100, help='unmeasured calls per scenario')
+    parser.add_argument('--port', type=int, default=9500)
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout,
+                        help='file for JSON lines, stdout by default')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    loop = asyncio.get_event_loop()
+    environment = dict(
+        asyncrpc=asyncrpc.__version__,
+        python=sys.version.split()[0],
+        timestamp=time.time()
+    )
+    for scenario in scenarios(args):
+        result = loop.run_until_complete(run_scenario(scenario, args.port, args.calls, args.warmup, loop))
+        result.update(environment)
+        args.output.write(json.dumps(result, sort_keys=True) + '\n')
+        args.output.flush()
@@ -8,8 +8,14 @@ setup(
     description='JSON RPC Server and Client',
     author='Seliverstov Maksim',
     author_email='Maksim.V.Seliverstov@yandex.ru',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     zip_safe=False,
     keywords=['rpc', 'jsonrpc', 'aiorpc', 'asyncrpc', 'multiple interfaces rpc'],
-    install_requires=['aiohttp']
+    install_requires=['aiohttp'],
+    extras_require={
+        'msgpack': ['msgpack'],
+        'orjson': ['orjson'],
+        'zstd': ['zstandard'],
+        'lz4': ['lz4'],
+    }
 )